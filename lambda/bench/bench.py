@@ -0,0 +1,252 @@
+"""오프라인 벤치마크 - 실제 키/거래소 없이 로컬 mock 서버로 성능 측정
+
+    python bench/bench.py                        # 기본: 서브계정 1, 10, 50, 100, 500
+    python bench/bench.py --scales 1,100 --latency 0.05 --jitter 0.02 --error-rate 0.01
+    python bench/bench.py --json out.json        # 결과 저장
+    python bench/bench.py --baseline out.json    # 이전 결과 대비 변화율 출력
+
+측정 대상: fetch_all_balances, calculate_usd_values, get_usd_value, 스냅샷 직렬화
+(diff + zlib pack/unpack). 지연은 p50/p95/p99, 처리량은 초당 실행 수,
+메모리는 tracemalloc 피크 (별도 1회 실행으로 측정해서 지연 수치에는 영향 없음)
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import urllib.parse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+# lambda_function은 import 시점에 환경변수를 읽으므로 먼저 설정
+BENCH_ENV = {
+    'BINANCE_API_KEY': 'bench', 'BINANCE_API_SECRET': 'bench',
+    'BYBIT_API_KEY': 'bench', 'BYBIT_API_SECRET': 'bench',
+    'OKX_API_KEY': 'bench', 'OKX_API_SECRET': 'bench', 'OKX_PASSPHRASE': 'bench',
+    'KUCOIN_API_KEY': 'bench', 'KUCOIN_API_SECRET': 'bench', 'KUCOIN_PASSPHRASE': 'bench',
+    'KRAKEN_API_KEY': 'bench', 'KRAKEN_API_SECRET': 'YmVuY2g=',
+    'ZOOMEX_API_KEY': 'bench', 'ZOOMEX_API_SECRET': 'bench',
+    'HTX_API_KEY': 'bench', 'HTX_API_SECRET': 'bench',
+    'LIVE_CACHE_TTL': '0',  # 매번 실제 조회
+    'LIVE_CACHE_BACKEND': 'file',
+    'ADAPTIVE_REFRESH': '0',
+    'METRICS_ENABLED': '0',
+}
+for key, value in BENCH_ENV.items():
+    os.environ.setdefault(key, value)
+
+import lambda_function as lf  # noqa: E402
+from mock_exchange import MockExchange  # noqa: E402
+
+DEFAULT_SCALES = [1, 10, 50, 100, 500]
+
+
+class MockPool(lf.HTTPPool):
+    """모든 요청을 mock 서버로 - https://host/path → http://127.0.0.1:port/host/path"""
+
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+
+    def request(self, method, url, headers, body=None, timeout=30):
+        parsed = urllib.parse.urlsplit(url)
+        local = f'{self.base}/{parsed.netloc}{parsed.path}'
+        if parsed.query:
+            local += f'?{parsed.query}'
+        return super().request(method, local, headers, body, timeout)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return lf.percentile(values, q)
+
+
+def measure(fn, iterations, setup=None, inner=1):
+    """iterations번 실행 - (실행당 ms 목록, 피크 메모리 KB)
+
+    setup()의 반환값을 fn에 넘김 (준비 시간은 측정에서 제외), inner는 실행당 반복 횟수
+    """
+    samples = []
+    for _ in range(iterations):
+        arg = setup() if setup else None
+        started = time.perf_counter()
+        for _ in range(inner):
+            fn(arg)
+        samples.append((time.perf_counter() - started) * 1000 / inner)
+
+    arg = setup() if setup else None
+    tracemalloc.start()
+    try:
+        fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return samples, peak / 1024
+
+
+def summarize(name, scale, samples, peak_kb, **extra):
+    mean = sum(samples) / len(samples)
+    return {
+        'name': name,
+        'scale': scale,
+        'iterations': len(samples),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(mean, 3),
+        'ops_per_sec': round(1000 / mean, 1) if mean else None,
+        'peak_kb': round(peak_kb, 1),
+        **extra,
+    }
+
+
+def quiet():
+    """fetcher들의 print 출력 숨김 (스레드 출력 포함)"""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def clone(obj):
+    return json.loads(json.dumps(obj))
+
+
+def bench_scale(mock, scale, iterations):
+    mock.scale = scale
+    # 서브계정 registry는 이전 규모의 목록을 들고 있으므로 규모마다 새로
+    lf.REGISTRIES.clear()
+    if os.path.exists(lf.LIVE_CACHE.path):
+        os.remove(lf.LIVE_CACHE.path)
+    results = []
+
+    # fetch_all_balances - 거래소 조회 + 가격 + 평가 + 응답 직렬화 전체
+    event = {'queryStringParameters': {}}
+    with quiet():
+        lf.fetch_all_balances(event)  # 연결/가격 캐시 워밍업
+        before = mock.requests
+        samples, peak = measure(lambda _: lf.fetch_all_balances(event), iterations)
+        calls = (mock.requests - before) / (iterations + 1)
+    results.append(summarize('fetch_all_balances', scale, samples, peak, http_calls=round(calls, 1)))
+
+    # 이후 벤치마크는 이 규모의 실제 조회 결과를 입력으로 사용
+    with quiet():
+        raw, _, _ = lf.fetch_exchanges_concurrently()
+    entries = sum(
+        len(data.get('master', {})) + sum(len(sub) for sub in data.get('subaccounts', {}).values())
+        for data in raw.values()
+    )
+
+    samples, peak = measure(lf.calculate_usd_values, iterations, setup=lambda: clone(raw))
+    results.append(summarize('calculate_usd_values', scale, samples, peak, entries=entries))
+
+    pairs = [
+        (coin, amt, data.get('usd_values'))
+        for data in raw.values()
+        for coin, amt in data.get('total', {}).items()
+    ]
+
+    def value_all(_):
+        for coin, amt, usd in pairs:
+            lf.get_usd_value(coin, amt, usd)
+
+    samples, peak = measure(value_all, iterations, inner=10)
+    per_call_us = [s * 1000 / max(len(pairs), 1) for s in samples]
+    results.append(summarize('get_usd_value', scale, samples, peak, calls_per_op=len(pairs),
+                             per_call_us=round(percentile(per_call_us, 50), 3)))
+
+    # 스냅샷 직렬화 - save_snapshot과 같은 flatten/diff/pack 경로 (DynamoDB 기록 제외)
+    valued = clone(raw)
+    lf.calculate_usd_values(valued)
+    previous = {ex: lf.flatten_tree(data) for ex, data in valued.items()}
+    changed = clone(valued)
+    for data in changed.values():
+        for coin in list(data.get('total', {}))[:3]:
+            data['total'][coin] *= 1.001
+
+    sizes = {}
+
+    def serialize(_):
+        packed = 0
+        for ex, data in changed.items():
+            flat = lf.flatten_tree(data)
+            delta = lf.diff_flat(previous[ex], flat)
+            blob = lf.pack(delta)
+            keyframe = lf.pack(data)
+            lf.unpack(blob)
+            packed += len(blob) + len(keyframe)
+        sizes['packed'] = packed
+
+    samples, peak = measure(serialize, iterations)
+    results.append(summarize('snapshot_serialize', scale, samples, peak, packed_bytes=sizes['packed'],
+                             json_bytes=len(json.dumps(changed))))
+    return results
+
+
+def print_table(results, baseline=None):
+    base = {(r['name'], r['scale']): r for r in baseline or []}
+    header = f"{'benchmark':<22}{'scale':>6}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'ops/s':>11}{'peak KB':>11}"
+    if base:
+        header += f"{'Δp50':>9}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        line = (f"{r['name']:<22}{r['scale']:>6}{r['p50_ms']:>11.3f}{r['p95_ms']:>11.3f}{r['p99_ms']:>11.3f}"
+                f"{r['ops_per_sec'] or 0:>11.1f}{r['peak_kb']:>11.1f}")
+        prev = base.get((r['name'], r['scale']))
+        if prev and prev['p50_ms']:
+            line += f"{(r['p50_ms'] / prev['p50_ms'] - 1) * 100:>+8.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmark against a local mock exchange server')
+    parser.add_argument('--scales', default=','.join(map(str, DEFAULT_SCALES)), help='서브계정 수 목록 (쉼표 구분)')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='요청당 지연 (초)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='지연 ± 범위 (초)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='500 응답 비율 (0~1)')
+    parser.add_argument('--fixtures', help='기록된 응답 디렉터리 (<호스트><경로의 / → _>.json)')
+    parser.add_argument('--real-limits', action='store_true', help='Binance weight 예산과 OKX 요청 한도를 실제 값으로 유지')
+    parser.add_argument('--json', help='결과를 JSON으로 저장')
+    parser.add_argument('--baseline', help='비교할 이전 --json 결과')
+    args = parser.parse_args()
+
+    mock = MockExchange(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, fixtures=args.fixtures)
+    lf.HTTP_POOL = MockPool(mock.start())
+    if not args.real_limits:
+        # mock은 weight 헤더를 보내지 않음 - 큰 규모에서 분 단위 대기로 측정이 멈추지 않도록
+        for budget in lf.BINANCE_BUDGETS.values():
+            budget.limit = float('inf')
+        for bucket in lf.OKX_BUCKETS.values():
+            bucket.capacity = bucket.tokens = bucket.rate = 1e9
+
+    results = []
+    try:
+        for scale in [int(s) for s in args.scales.split(',')]:
+            print(f"scale {scale}...", file=sys.stderr)
+            results.extend(bench_scale(mock, scale, args.iterations))
+    finally:
+        mock.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    print_table(results, baseline)
+    print(f"\nmock requests: {mock.requests}, injected errors: {mock.errors}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': sys.version.split()[0],
+                'options': vars(args),
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""import 시간 벤치마크 - lambda_function 모듈 초기화가 예산을 넘으면 실패 (exit 1)
+
+    python bench/import_time.py                  # 기본 예산 150ms, 7회 중앙값
+    python bench/import_time.py --budget-ms 100 --runs 11
+
+매 실행마다 새 인터프리터에서 `python -X importtime -c "import lambda_function"`을 돌려서
+lambda_function의 누적 import 시간을 측정. boto3는 첫 사용 시 import하므로 여기엔 포함되지 않음 -
+LIVE_CACHE_BACKEND=dynamodb면 그 비용은 첫 요청의 runtime.lazy_init_ms에 나타남
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', '150'))
+LAZY_MODULES = ['boto3', 'botocore']  # 첫 사용 시 import - 측정에서 빠지는 모듈 (참고용 출력)
+
+
+def import_profile():
+    """새 프로세스에서 import - {모듈: (self us, cumulative us)}"""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import lambda_function'],
+        cwd=LAMBDA_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.exit(f"import failed:\n{proc.stderr}")
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        profile[name.strip()] = (int(self_us), int(cumulative_us))
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail when lambda_function import time exceeds a budget')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--top', type=int, default=10, help='가장 오래 걸린 import 몇 개 출력')
+    args = parser.parse_args()
+
+    profiles = [import_profile() for _ in range(args.runs)]
+    totals = [p['lambda_function'][1] / 1000 for p in profiles]
+    median = statistics.median(totals)
+
+    last = profiles[-1]
+    print(f"lambda_function import: median {median:.1f}ms, min {min(totals):.1f}ms, max {max(totals):.1f}ms "
+          f"({args.runs} runs, budget {args.budget_ms:.0f}ms)")
+    print(f"\ntop {args.top} by self time (last run):")
+    for name, (self_us, cumulative_us) in sorted(last.items(), key=lambda kv: -kv[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.2f}ms self {cumulative_us / 1000:8.2f}ms cumulative  {name}")
+
+    eager = [name for name in LAZY_MODULES if name in last]
+    if eager:
+        print(f"\nnote: imported at module load: {', '.join(eager)}")
+    if median > args.budget_ms:
+        print(f"\nFAIL: import time {median:.1f}ms over budget {args.budget_ms:.0f}ms")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,393 @@
+"""벤치마크용 로컬 거래소 서버 - fetch_* 가 호출하는 엔드포인트에 합성(또는 기록된) 응답
+
+요청 경로는 /<원래 호스트><원래 경로> 형태 (MockPool이 URL을 바꿔서 보냄)
+- 서브계정 수(scale), 지연(latency ± jitter), 에러 비율(error_rate)을 런타임에 바꿀 수 있음
+- fixtures 디렉터리에 <호스트><경로의 / → _>.json 파일이 있으면 합성 응답 대신 그대로 반환
+"""
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 가격 (Binance USDT 페어가 있는 코인)
+PRICES = {
+    'BTC': 65000.0, 'ETH': 3200.0, 'BNB': 580.0, 'SOL': 150.0, 'XRP': 0.52, 'DOGE': 0.12,
+    'ADA': 0.45, 'AVAX': 28.0, 'LINK': 14.0, 'DOT': 6.5, 'TRX': 0.12, 'TON': 6.8, 'SUI': 1.1,
+}
+STABLES = ['USDT', 'USDC']
+# Binance에 없어서 보조 소스(OKX/Bybit 티커)로 채워지는 코인
+OFF_BINANCE = {'OKB': 48.0, 'MNT': 0.9}
+COINS = list(PRICES) + STABLES
+FILLER_SYMBOLS = 1500  # 전체 티커 응답 크기를 실제와 비슷하게
+HTX_ZERO_ROWS = 300  # HTX 잔고 응답의 0 잔고 행 수
+
+
+def amount(rng, coin):
+    price = PRICES.get(coin) or OFF_BINANCE.get(coin) or 1.0
+    return round(rng.uniform(10, 5000) / price, 8)
+
+
+def coins_for(seed, k=4):
+    rng = random.Random(seed)
+    return rng, rng.sample(COINS, k)
+
+
+class MockExchange:
+    def __init__(self, scale=10, latency=0.0, jitter=0.0, error_rate=0.0, fixtures=None, seed=0):
+        self.scale = scale
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.fixtures = fixtures
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.server = None
+        self.routes = {
+            # Binance
+            ('api.binance.com', '/api/v3/ticker/price'): self.binance_ticker,
+            ('api.binance.com', '/api/v3/account'): self.binance_account,
+            ('api.binance.com', '/sapi/v1/simple-earn/flexible/position'): self.binance_earn_flexible,
+            ('api.binance.com', '/sapi/v1/simple-earn/locked/position'): self.binance_earn_locked,
+            ('fapi.binance.com', '/fapi/v2/account'): self.binance_futures,
+            ('api.binance.com', '/sapi/v1/sub-account/list'): self.binance_sub_list,
+            ('api.binance.com', '/sapi/v1/sub-account/spotSummary'): self.binance_spot_summary,
+            ('api.binance.com', '/sapi/v2/sub-account/futures/accountSummary'): self.binance_futures_summary,
+            ('api.binance.com', '/sapi/v1/sub-account/margin/accountSummary'): self.binance_margin_summary,
+            ('api.binance.com', '/sapi/v4/sub-account/assets'): self.binance_sub_assets,
+            ('api.binance.com', '/sapi/v2/sub-account/futures/account'): self.binance_sub_futures,
+            ('api.binance.com', '/sapi/v1/sub-account/margin/account'): self.binance_sub_margin,
+            # Bybit
+            ('api.bybit.com', '/v5/account/wallet-balance'): self.bybit_wallet,
+            ('api.bybit.com', '/v5/asset/transfer/query-account-coins-balance'): self.bybit_coins_balance,
+            ('api.bybit.com', '/v5/user/query-sub-members'): self.bybit_sub_members,
+            ('api.bybit.com', '/v5/market/tickers'): self.bybit_tickers,
+            # OKX
+            ('www.okx.com', '/api/v5/account/balance'): self.okx_balance,
+            ('www.okx.com', '/api/v5/users/subaccount/list'): self.okx_sub_list,
+            ('www.okx.com', '/api/v5/account/subaccount/balances'): self.okx_sub_balances,
+            ('www.okx.com', '/api/v5/market/ticker'): self.okx_ticker,
+            # KuCoin
+            ('api.kucoin.com', '/api/v1/accounts'): self.kucoin_accounts,
+            ('api.kucoin.com', '/api/v2/sub/user'): self.kucoin_sub_users,
+            ('api.kucoin.com', '/api/v1/sub-accounts/{id}'): self.kucoin_sub_account,
+            ('api.kucoin.com', '/api/v2/sub-accounts'): self.kucoin_sub_accounts,
+            ('api.kucoin.com', '/api/v1/market/orderbook/level1'): self.kucoin_level1,
+            # Kraken
+            ('api.kraken.com', '/0/private/Balance'): self.kraken_balance,
+            ('api.kraken.com', '/0/public/Ticker'): self.kraken_ticker,
+            # Zoomex
+            ('openapi.zoomex.com', '/cloud/trade/v3/account/wallet-balance'): self.zoomex_wallet,
+            # HTX
+            ('api.huobi.pro', '/v1/account/accounts'): self.htx_accounts,
+            ('api.huobi.pro', '/v1/account/accounts/{id}/balance'): self.htx_balance,
+            ('api.huobi.pro', '/market/detail/merged'): self.htx_merged,
+        }
+
+    # ---------- server ----------
+    def start(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive (HTTPPool 재사용 경로까지 측정)
+            disable_nagle_algorithm = True  # 헤더/본문 분할 전송 시 delayed ACK 40ms 대기 방지
+
+            def do_GET(self):
+                mock.handle(self)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                mock.handle(self)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def handle(self, request):
+        parsed = urllib.parse.urlsplit(request.path)
+        host, _, path = parsed.path.lstrip('/').partition('/')
+        path = '/' + path
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+
+        with self.lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            self.send(request, 500, {'code': -1, 'msg': 'injected error'})
+            return
+        handler, path_id = self.route(host, path)
+        if handler is None:
+            self.send(request, 404, {'code': -1, 'msg': f'no fixture for {host}{path}'})
+            return
+        fixture = self.load_fixture(host, path)
+        self.send(request, 200, fixture if fixture is not None else handler(query, path_id))
+
+    def route(self, host, path):
+        if (host, path) in self.routes:
+            return self.routes[(host, path)], None
+        # 경로에 id가 들어가는 엔드포인트
+        parts = path.split('/')
+        for i, part in enumerate(parts):
+            if part.isdigit() or part.startswith('uid'):
+                templated = '/'.join(parts[:i] + ['{id}'] + parts[i + 1:])
+                if (host, templated) in self.routes:
+                    return self.routes[(host, templated)], part
+        return None, None
+
+    def load_fixture(self, host, path):
+        if not self.fixtures:
+            return None
+        name = os.path.join(self.fixtures, host + path.replace('/', '_') + '.json')
+        if not os.path.exists(name):
+            return None
+        with open(name) as f:
+            return json.load(f)
+
+    @staticmethod
+    def send(request, status, payload):
+        body = json.dumps(payload).encode()
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    # ---------- helpers ----------
+    def emails(self):
+        return [f'sub{i}@bench.local' for i in range(self.scale)]
+
+    @staticmethod
+    def sub_index(email):
+        return int(email[3:].split('@')[0])
+
+    @staticmethod
+    def page(rows, query, size_param):
+        page = int(query.get('page', 1))
+        size = int(query.get(size_param, 20))
+        return rows[(page - 1) * size:page * size]
+
+    def balances(self, seed, k=4):
+        rng, coins = coins_for(seed, k)
+        return {coin: amount(rng, coin) for coin in coins}
+
+    # ---------- Binance ----------
+    def binance_ticker(self, query, _):
+        rows = [{'symbol': f'{coin}USDT', 'price': str(price)} for coin, price in PRICES.items()]
+        rows.append({'symbol': 'USDCUSDT', 'price': '1.0001'})
+        if 'symbols' in query:
+            wanted = set(json.loads(query['symbols']))
+            return [r for r in rows if r['symbol'] in wanted]
+        rows += [{'symbol': f'F{i}USDT', 'price': '1.5'} for i in range(FILLER_SYMBOLS)]
+        return rows
+
+    def binance_account(self, query, _):
+        return {'balances': [
+            {'asset': coin, 'free': str(amt), 'locked': '0'} for coin, amt in self.balances('binance-master', 8).items()
+        ] + [{'asset': f'Z{i}', 'free': '0', 'locked': '0'} for i in range(200)]}
+
+    def binance_earn_flexible(self, query, _):
+        return {'rows': [{'asset': 'USDT', 'totalAmount': '2500'}, {'asset': 'ETH', 'totalAmount': '1.5'}], 'total': 2}
+
+    def binance_earn_locked(self, query, _):
+        return {'rows': [{'asset': 'SOL', 'amount': '40'}], 'total': 1}
+
+    def binance_futures(self, query, _):
+        return {'assets': [
+            {'asset': 'USDT', 'walletBalance': '12000', 'unrealizedProfit': '-150.5', 'marginBalance': '11849.5'},
+            {'asset': 'BNB', 'walletBalance': '0', 'unrealizedProfit': '0', 'marginBalance': '0'},
+        ]}
+
+    def binance_sub_list(self, query, _):
+        return {'subAccounts': [{'email': e} for e in self.emails()]}
+
+    def binance_spot_summary(self, query, _):
+        rows = [{'email': e, 'totalAsset': '0.5'} for e in self.emails()]
+        return {'totalCount': len(rows), 'spotSubUserAssetBtcVoList': self.page(rows, query, 'size')}
+
+    def binance_futures_summary(self, query, _):
+        emails = self.emails()
+        if query.get('futuresType') == '2':
+            rows = [{'email': e, 'totalMarginBalanceOfBTC': '0.1' if i % 5 == 0 else '0'} for i, e in enumerate(emails)]
+            return {'deliveryAccountSummaryResp': {'subAccountList': self.page(rows, query, 'limit')}}
+        rows = [{'email': e, 'totalMarginBalance': '1000' if i % 2 == 0 else '0'} for i, e in enumerate(emails)]
+        return {'futureAccountSummaryResp': {'subAccountList': self.page(rows, query, 'limit')}}
+
+    def binance_margin_summary(self, query, _):
+        return {'subAccountList': [
+            {'email': e, 'totalAssetOfBtc': '0.05' if i % 7 == 0 else '0', 'totalLiabilityOfBtc': '0'}
+            for i, e in enumerate(self.emails())
+        ]}
+
+    def binance_sub_assets(self, query, _):
+        return {'balances': [
+            {'asset': coin, 'free': str(amt), 'locked': '0'}
+            for coin, amt in self.balances(f"binance-{query.get('email')}").items()
+        ]}
+
+    def binance_sub_futures(self, query, _):
+        i = self.sub_index(query.get('email', 'sub0@'))
+        if query.get('futuresType') == '2':
+            return {'deliveryAccountResp': {'assets': [{'asset': 'BTC', 'marginBalance': str(0.01 * (i + 1))}]}}
+        return {'futureAccountResp': {'assets': [
+            {'asset': 'USDT', 'walletBalance': '1000', 'unrealizedProfit': str(i % 11 - 5), 'marginBalance': str(1000 + i % 11 - 5)},
+        ]}}
+
+    def binance_sub_margin(self, query, _):
+        return {'marginUserAssetVoList': [{'asset': 'ETH', 'netAsset': '0.25'}, {'asset': 'USDT', 'netAsset': '-100'}]}
+
+    # ---------- Bybit ----------
+    def bybit_coins(self, seed, k=5):
+        return [
+            {'coin': coin, 'equity': str(amt), 'walletBalance': str(amt), 'unrealisedPnl': '0'}
+            for coin, amt in self.balances(seed, k).items()
+        ]
+
+    def bybit_wallet(self, query, _):
+        return {'retCode': 0, 'result': {'list': [{'coin': self.bybit_coins('bybit-master', 6)}]}}
+
+    def bybit_coins_balance(self, query, _):
+        seed = f"bybit-{query.get('memberId', 'fund')}"
+        return {'retCode': 0, 'result': {'balance': [
+            {'coin': coin, 'walletBalance': str(amt)} for coin, amt in self.balances(seed, 3).items()
+        ]}}
+
+    def bybit_sub_members(self, query, _):
+        return {'retCode': 0, 'result': {'subMembers': [
+            {'uid': str(100000 + i), 'username': f'bybitsub{i}'} for i in range(self.scale)
+        ]}}
+
+    def bybit_tickers(self, query, _):
+        rows = [{'symbol': f'{coin}USDT', 'lastPrice': str(price)} for coin, price in {**PRICES, **OFF_BINANCE}.items()]
+        if 'symbol' in query:
+            rows = [row for row in rows if row['symbol'] == query['symbol']]
+            if not rows:
+                return {'retCode': 10001, 'retMsg': 'Not supported symbols', 'result': {}}
+        return {'retCode': 0, 'result': {'list': rows}}
+
+    # ---------- OKX ----------
+    def okx_details(self, seed, k=4):
+        return [
+            {'ccy': coin, 'cashBal': str(amt), 'eqUsd': str(round(amt * (PRICES.get(coin) or OFF_BINANCE.get(coin) or 1), 2))}
+            for coin, amt in self.balances(seed, k).items()
+        ]
+
+    def okx_balance(self, query, _):
+        details = self.okx_details('okx-master', 6)
+        details.append({'ccy': 'OKB', 'cashBal': '25', 'eqUsd': '1200'})
+        return {'code': '0', 'data': [{'details': details}]}
+
+    def okx_sub_list(self, query, _):
+        # 생성 시각 역순, after=ts보다 오래된 것부터 limit개
+        rows = [{'subAcct': f'okxsub{i}', 'ts': str(1700000000000 - i)} for i in range(self.scale)]
+        if 'after' in query:
+            rows = [row for row in rows if int(row['ts']) < int(query['after'])]
+        return {'code': '0', 'data': rows[:int(query.get('limit', 100))]}
+
+    def okx_sub_balances(self, query, _):
+        return {'code': '0', 'data': [{'details': self.okx_details(f"okx-{query.get('subAcct')}")}]}
+
+    def okx_ticker(self, query, _):
+        coin = query.get('instId', '').split('-')[0]
+        price = PRICES.get(coin) or OFF_BINANCE.get(coin)
+        if not price:
+            return {'code': '51001', 'msg': "Instrument ID doesn't exist", 'data': []}
+        return {'code': '0', 'data': [{'instId': query['instId'], 'last': str(price)}]}
+
+    # ---------- KuCoin ----------
+    def kucoin_accounts(self, query, _):
+        return {'code': '200000', 'data': [
+            {'currency': coin, 'type': 'trade', 'balance': str(amt)} for coin, amt in self.balances('kucoin-master', 5).items()
+        ]}
+
+    @staticmethod
+    def kucoin_page(items, query):
+        page = int(query.get('currentPage', 1))
+        size = int(query.get('pageSize', 10))
+        return {'code': '200000', 'data': {
+            'currentPage': page, 'pageSize': size, 'totalNum': len(items),
+            'totalPage': max((len(items) + size - 1) // size, 1),
+            'items': items[(page - 1) * size:page * size],
+        }}
+
+    def kucoin_sub_users(self, query, _):
+        return self.kucoin_page([{'userId': f'uid{i}', 'subName': f'kcsub{i}'} for i in range(self.scale)], query)
+
+    def kucoin_sub_balances(self, uid):
+        rows = [{'currency': coin, 'balance': str(amt)} for coin, amt in self.balances(f'kucoin-{uid}').items()]
+        return {'mainAccounts': rows[:2], 'tradeAccounts': rows[2:], 'marginAccounts': []}
+
+    def kucoin_sub_account(self, query, uid):
+        return {'code': '200000', 'data': self.kucoin_sub_balances(uid)}
+
+    def kucoin_sub_accounts(self, query, _):
+        return self.kucoin_page([
+            {'subUserId': f'uid{i}', 'subName': f'kcsub{i}', **self.kucoin_sub_balances(f'uid{i}')}
+            for i in range(self.scale)
+        ], query)
+
+    def kucoin_level1(self, query, _):
+        price = PRICES.get(query.get('symbol', '').split('-')[0])
+        return {'code': '200000', 'data': {'price': str(price)} if price else None}
+
+    # ---------- Kraken ----------
+    def kraken_balance(self, query, _):
+        return {'error': [], 'result': {'XXBT': '0.75', 'XETH': '4.2', 'ZUSD': '1500.0', 'SOL': '30'}}
+
+    def kraken_ticker(self, query, _):
+        pairs = {
+            'XBTUSD': ('XXBTZUSD', PRICES['BTC']),
+            'ETHUSD': ('XETHZUSD', PRICES['ETH']),
+            'SOLUSD': ('SOLUSD', PRICES['SOL']),
+        }
+        if query.get('pair') not in pairs:
+            return {'error': ['EQuery:Unknown asset pair']}
+        name, price = pairs[query['pair']]
+        return {'error': [], 'result': {name: {'c': [str(price), '1']}}}
+
+    # ---------- Zoomex ----------
+    def zoomex_wallet(self, query, _):
+        return {'retCode': 0, 'result': {'list': [{
+            'totalEquity': '5000', 'totalWalletBalance': '5100', 'totalPerpUPL': '-100',
+            'coin': [{'coin': 'USDT', 'equity': '5000', 'walletBalance': '5100', 'unrealisedPnl': '-100'}],
+        }]}}
+
+    # ---------- HTX ----------
+    def htx_accounts(self, query, _):
+        return {'status': 'ok', 'data': [
+            {'id': 1001, 'type': 'spot'}, {'id': 1002, 'type': 'margin'}, {'id': 1003, 'type': 'super-margin'},
+        ]}
+
+    def htx_balance(self, query, acc_id):
+        rows = [
+            {'currency': coin.lower(), 'type': 'trade', 'balance': str(amt)}
+            for coin, amt in self.balances(f'htx-{acc_id}', 3).items()
+        ]
+        rows += [{'currency': f'z{i}', 'type': 'trade', 'balance': '0'} for i in range(HTX_ZERO_ROWS)]
+        return {'status': 'ok', 'data': {'id': int(acc_id), 'list': rows}}
+
+    def htx_merged(self, query, _):
+        price = PRICES.get(query.get('symbol', '').upper().removesuffix('USDT'))
+        if not price:
+            return {'status': 'error', 'err-code': 'invalid-parameter', 'err-msg': 'invalid symbol'}
+        return {'status': 'ok', 'tick': {'close': price}}
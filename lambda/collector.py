@@ -0,0 +1,460 @@
+"""실시간 잔고 수집 데몬 - 거래소 private WebSocket으로 마스터 잔고를 증분 갱신
+
+Lambda 옆에 컨테이너/데몬으로 실행: python collector.py
+- 시작 시 REST(fetch_*)로 전체 잔고를 받고, 이후 WebSocket 이벤트로 마스터 계정 잔고만 갱신
+  (Binance spot, Bybit wallet, OKX account)
+- Binance USDT-M 선물은 REST 재동기화로만 갱신 - ACCOUNT_UPDATE는 바뀐 자산/포지션만 보내고
+  mark price 변화에 따른 uPnL은 보내지 않아서 스트림만으로는 marginBalance를 맞출 수 없음
+- 서브계정은 스트림이 없으므로 RESYNC_SECONDS마다 REST로 다시 맞춤
+- GET /balances 는 Lambda와 같은 응답 스키마
+- COLLECTOR_PUBLISH=1이면 갱신된 잔고를 live 캐시 섹션(section#<거래소>)으로 기록해 Lambda가 재사용
+"""
+import json
+import hmac
+import hashlib
+import time
+import base64
+import os
+import socket
+import ssl
+import struct
+import threading
+import urllib.parse
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import lambda_function as lf
+
+RESYNC_SECONDS = float(os.environ.get('RESYNC_SECONDS', '300'))  # REST 전체 재동기화 주기
+PUBLISH_SECONDS = float(os.environ.get('PUBLISH_SECONDS', '5'))  # live 캐시 기록 주기
+COLLECTOR_PUBLISH = os.environ.get('COLLECTOR_PUBLISH', '0') == '1'
+COLLECTOR_PORT = int(os.environ.get('COLLECTOR_PORT', '8080'))
+PING_SECONDS = 20
+LISTEN_KEY_RENEW_SECONDS = 30 * 60  # Binance listenKey는 60분 내 연장 필요
+
+# 거래소별 잔고 (fetch_* 결과와 같은 형식)
+BOOKS = {}
+BOOK_TIMES = {}  # exchange -> 마지막 REST 재동기화 시각 (서브계정, Binance 선물은 이 시각 기준)
+MASTER_TIMES = {}  # exchange -> 마지막 스트림 갱신 시각 (마스터 잔고만)
+LIVE_STREAMS = {}  # exchange -> 연결된 스트림 수 (연결 중이면 마스터 잔고는 현재 시각 기준)
+BOOK_LOCK = threading.Lock()
+
+
+# ============ WEBSOCKET ============
+class WebSocket:
+    """최소 RFC 6455 클라이언트 (텍스트 프레임, ping/pong, close)"""
+
+    def __init__(self, url, timeout=PING_SECONDS):
+        parsed = urllib.parse.urlsplit(url)
+        secure = parsed.scheme == 'wss'
+        port = parsed.port or (443 if secure else 80)
+        sock = socket.create_connection((parsed.hostname, port), timeout=timeout)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parsed.hostname)
+        self.sock = sock
+        self.lock = threading.Lock()
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {parsed.hostname}\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\n'
+            'Sec-WebSocket-Version: 13\r\n\r\n'
+        )
+        sock.sendall(request.encode())
+
+        response = b''
+        while b'\r\n\r\n' not in response:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise ConnectionError('handshake closed')
+            response += chunk
+        head, self.buffer = response.split(b'\r\n\r\n', 1)
+        self.fragments = b''  # 아직 끝나지 않은 (FIN 전) 메시지
+        if b' 101 ' not in head.split(b'\r\n')[0]:
+            status = head.split(b'\r\n')[0].decode()
+            raise ConnectionError(f"handshake failed: {status}")
+
+    def _send_frame(self, opcode, payload):
+        header = bytes([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header += bytes([0x80 | length])
+        elif length < 65536:
+            header += bytes([0x80 | 126]) + struct.pack('!H', length)
+        else:
+            header += bytes([0x80 | 127]) + struct.pack('!Q', length)
+        # 클라이언트 → 서버 프레임은 반드시 마스킹
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        with self.lock:
+            self.sock.sendall(header + mask + masked)
+
+    def send(self, text):
+        self._send_frame(0x1, text.encode())
+
+    def _take_frame(self):
+        """버퍼에 완성된 프레임이 있으면 꺼내서 (fin, opcode, payload), 없으면 None (버퍼는 그대로)"""
+        buf = self.buffer
+        if len(buf) < 2:
+            return None
+        first, second = buf[0], buf[1]
+        length = second & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buf) < 4:
+                return None
+            length = struct.unpack('!H', buf[2:4])[0]
+            offset = 4
+        elif length == 127:
+            if len(buf) < 10:
+                return None
+            length = struct.unpack('!Q', buf[2:10])[0]
+            offset = 10
+        mask = None
+        if second & 0x80:
+            if len(buf) < offset + 4:
+                return None
+            mask = buf[offset:offset + 4]
+            offset += 4
+        if len(buf) < offset + length:
+            return None
+        payload = buf[offset:offset + length]
+        self.buffer = buf[offset + length:]
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return bool(first & 0x80), first & 0x0F, payload
+
+    def recv(self):
+        """다음 텍스트 메시지 - 대기 시간 초과 시 socket.timeout
+        
+        프레임이 다 도착해야 버퍼에서 꺼내므로 중간에 timeout이 나도 다음 recv에서 이어서 읽음
+        """
+        while True:
+            frame = self._take_frame()
+            if frame is None:
+                chunk = self.sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError('socket closed')
+                self.buffer += chunk
+                continue
+            fin, opcode, payload = frame
+            if opcode == 0x9:  # ping
+                self._send_frame(0xA, payload)
+            elif opcode == 0x8:  # close
+                raise ConnectionError('closed by server')
+            elif opcode in (0x0, 0x1, 0x2):
+                self.fragments += payload
+                if fin:
+                    message, self.fragments = self.fragments, b''
+                    return message.decode()
+
+    def close(self):
+        try:
+            self._send_frame(0x8, b'')
+        except OSError:
+            pass
+        self.sock.close()
+
+
+# ============ BOOKS ============
+def recompute_total(book):
+    """master + subaccounts로 total 다시 계산"""
+    total = dict(book['master'])
+    for sub_bal in book['subaccounts'].values():
+        for ccy, amt in sub_bal.items():
+            total[ccy] = total.get(ccy, 0) + amt
+    book['total'] = total
+
+
+def update_master(exchange, values):
+    """마스터 잔고 키별 갱신 (0이면 삭제) 후 total 재계산
+    
+    REST의 usd_values는 마스터+서브 합계라 바뀐 코인은 지워서 가격 기준으로 평가
+    """
+    with BOOK_LOCK:
+        book = BOOKS.get(exchange)
+        if book is None:
+            return
+        for key, amount in values.items():
+            if amount:
+                book['master'][key] = amount
+            else:
+                book['master'].pop(key, None)
+        for key in values:
+            book.get('usd_values', {}).pop(key, None)
+        recompute_total(book)
+        MASTER_TIMES[exchange] = time.time()
+
+
+def resync(exchange):
+    """REST로 전체 잔고 다시 받기 (서브계정 포함)"""
+    fetcher = dict((key, fn) for key, _, _, fn in lf.EXCHANGES)[exchange]
+    book = getattr(lf, fetcher)()
+    with BOOK_LOCK:
+        BOOKS[exchange] = book
+        BOOK_TIMES[exchange] = time.time()
+    print(f"Resynced {exchange}: {len(book.get('total', {}))} assets")
+
+
+# ============ STREAMS ============
+def run_stream(exchange, name, connect, handle, keepalive=None):
+    """연결 → 메시지 처리 루프, 끊기면 지수 백오프로 재연결"""
+    backoff = 1
+    while True:
+        ws = None
+        connected = False
+        try:
+            ws = connect()
+            print(f"{name} stream connected")
+            with BOOK_LOCK:
+                LIVE_STREAMS[exchange] = LIVE_STREAMS.get(exchange, 0) + 1
+            connected = True
+            backoff = 1
+            last_ping = time.time()
+            while True:
+                try:
+                    handle(json.loads(ws.recv()))
+                except socket.timeout:
+                    pass
+                except json.JSONDecodeError:
+                    pass  # 'pong' 같은 텍스트 응답
+                if keepalive and time.time() - last_ping >= PING_SECONDS:
+                    keepalive(ws)
+                    last_ping = time.time()
+        except Exception as e:
+            print(f"{name} stream error: {e} - reconnecting in {backoff}s")
+        finally:
+            if connected:
+                with BOOK_LOCK:
+                    LIVE_STREAMS[exchange] -= 1
+            if ws:
+                ws.close()
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+def binance_streams():
+    api_key = os.environ['BINANCE_API_KEY']
+    headers = {'X-MBX-APIKEY': api_key}
+    listen = {'key': None, 'renewed': 0}  # 현재 연결의 listenKey - 연장은 연결된 스트림 안에서만
+
+    def connect():
+        listen['key'] = lf.http_request('https://api.binance.com/api/v3/userDataStream', dict(headers), method='POST')['listenKey']
+        listen['renewed'] = time.time()
+        return WebSocket(f"wss://stream.binance.com:9443/ws/{listen['key']}")
+
+    def keepalive(ws):
+        if time.time() - listen['renewed'] < LISTEN_KEY_RENEW_SECONDS:
+            return
+        listen['renewed'] = time.time()
+        try:
+            lf.http_request(f"https://api.binance.com/api/v3/userDataStream?listenKey={listen['key']}", dict(headers), method='PUT')
+        except Exception as e:
+            print(f"Binance listenKey keepalive error: {e}")
+
+    def handle_spot(msg):
+        if msg.get('e') == 'outboundAccountPosition':
+            update_master('binance', {b['a']: float(b['f']) + float(b['l']) for b in msg.get('B', [])})
+
+    threading.Thread(target=run_stream, daemon=True, args=(
+        'binance', 'Binance spot', connect, handle_spot, keepalive,
+    )).start()
+
+
+def bybit_stream():
+    api_key = os.environ['BYBIT_API_KEY']
+    api_secret = os.environ['BYBIT_API_SECRET']
+
+    def connect():
+        ws = WebSocket('wss://stream.bybit.com/v5/private')
+        expires = int((time.time() + 10) * 1000)
+        signature = hmac.new(api_secret.encode(), f'GET/realtime{expires}'.encode(), hashlib.sha256).hexdigest()
+        ws.send(json.dumps({'op': 'auth', 'args': [api_key, expires, signature]}))
+        ws.send(json.dumps({'op': 'subscribe', 'args': ['wallet']}))
+        return ws
+
+    def handle(msg):
+        if msg.get('topic') != 'wallet':
+            return
+        for account in msg.get('data', []):
+            if account.get('accountType') != 'UNIFIED':
+                continue
+            # fetch_bybit과 동일: equity 우선, 0이면 walletBalance
+            values = {}
+            for coin in account.get('coin', []):
+                equity = float(coin.get('equity') or 0) or float(coin.get('walletBalance') or 0)
+                values[coin['coin']] = equity
+            update_master('bybit', values)
+
+    threading.Thread(target=run_stream, daemon=True, args=(
+        'bybit', 'Bybit', connect, handle, lambda ws: ws.send(json.dumps({'op': 'ping'})),
+    )).start()
+
+
+def okx_stream():
+    api_key = os.environ['OKX_API_KEY']
+    api_secret = os.environ['OKX_API_SECRET']
+    passphrase = os.environ['OKX_PASSPHRASE']
+
+    def connect():
+        ws = WebSocket('wss://ws.okx.com:8443/ws/v5/private')
+        timestamp = str(int(time.time()))
+        sign = base64.b64encode(
+            hmac.new(api_secret.encode(), f'{timestamp}GET/users/self/verify'.encode(), hashlib.sha256).digest()
+        ).decode()
+        ws.send(json.dumps({'op': 'login', 'args': [
+            {'apiKey': api_key, 'passphrase': passphrase, 'timestamp': timestamp, 'sign': sign}
+        ]}))
+        # 로그인 응답 후 구독
+        while json.loads(ws.recv()).get('event') != 'login':
+            pass
+        ws.send(json.dumps({'op': 'subscribe', 'args': [{'channel': 'account'}]}))
+        return ws
+
+    def handle(msg):
+        if msg.get('arg', {}).get('channel') != 'account' or 'data' not in msg:
+            return
+        values = {}
+        for account in msg['data']:
+            for detail in account.get('details', []):
+                values[detail['ccy']] = max(float(detail.get('cashBal') or 0), 0)
+        update_master('okx', values)
+
+    threading.Thread(target=run_stream, daemon=True, args=(
+        'okx', 'OKX', connect, handle, lambda ws: ws.send('ping'),
+    )).start()
+
+
+STREAMS = {
+    'binance': binance_streams,
+    'bybit': bybit_stream,
+    'okx': okx_stream,
+}
+
+
+# ============ LOOPS ============
+def resync_loop(exchanges):
+    """주기적 REST 재동기화 (서브계정, 스트림 누락분 보정)"""
+    while True:
+        time.sleep(RESYNC_SECONDS)
+        for exchange in exchanges:
+            try:
+                resync(exchange)
+            except Exception as e:
+                print(f"Resync {exchange} error: {e}")
+
+
+def master_times():
+    """거래소별 마스터 잔고 기준 시각 - 스트림이 연결돼 있으면 현재 시각, 아니면 마지막 갱신 시각
+
+    서브계정과 Binance 선물은 스트림이 없으므로 항상 BOOK_TIMES(REST 재동기화) 기준
+    """
+    now = time.time()
+    with BOOK_LOCK:
+        return {
+            ex: now if LIVE_STREAMS.get(ex) else max(t, MASTER_TIMES.get(ex, 0))
+            for ex, t in BOOK_TIMES.items()
+        }
+
+
+def publish_loop():
+    """잔고를 live 캐시 섹션으로 기록 - Lambda 스케줄러가 다음 재동기화 전까지 조회 없이 재사용
+
+    fetched_at은 REST 재동기화 시각 (잔고 중 가장 오래된 부분), interval은 다음 재동기화까지 -
+    재동기화가 멈추면 Lambda가 직접 조회
+    """
+    while True:
+        time.sleep(PUBLISH_SECONDS)
+        with BOOK_LOCK:
+            books = json.loads(json.dumps(BOOKS))
+            times = dict(BOOK_TIMES)
+        for exchange, book in books.items():
+            try:
+                lf.LIVE_CACHE.put(f'section#{exchange}', {
+                    'data': book,
+                    'fetched_at': times[exchange],
+                    'fingerprint': lf.fingerprint(book),
+                    'interval': RESYNC_SECONDS + PUBLISH_SECONDS * 3,
+                }, versioned=False)
+            except Exception as e:
+                print(f"Publish {exchange} error: {e}")
+
+
+def build_response():
+    """현재 잔고로 Lambda와 같은 스키마의 응답 생성"""
+    masters = master_times()
+    with BOOK_LOCK:
+        balances = json.loads(json.dumps(BOOKS))
+        times = dict(BOOK_TIMES)
+
+    lf.fetch_prices(lf.held_assets(balances))
+    fill = lf.needs_fill(balances)
+    if fill:
+        lf.fill_prices(fill)
+    lf.calculate_usd_values(balances)
+
+    now = time.time()
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'grand_total_usd': round(sum(d.get('exchange_total_usd', 0) for d in balances.values()), 2),
+        'balances': balances,
+        'errors': None,
+        'price_ages': lf.price_ages(balances),
+        'unpriced_assets': sorted(c for c in lf.held_assets(balances) if not lf.PRICES.get(c)),
+        'freshness': {
+            exchange: {
+                'fetched_at': datetime.fromtimestamp(t, timezone.utc).isoformat(),
+                'age': round(now - t, 1),
+                'master_age': round(now - masters[exchange], 1),
+                'source': 'stream' if LIVE_STREAMS.get(exchange) else 'rest',
+            }
+            for exchange, t in times.items()
+        },
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/balances'):
+            self.send_error(404)
+            return
+        body = json.dumps(build_response()).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main():
+    exchanges = [key for key, _, env_key, _ in lf.EXCHANGES if os.environ.get(env_key)]
+    for exchange in exchanges:
+        try:
+            resync(exchange)
+        except Exception as e:
+            print(f"Initial {exchange} fetch error: {e}")
+
+    for exchange in exchanges:
+        if exchange in STREAMS and exchange in BOOKS:
+            STREAMS[exchange]()
+
+    threading.Thread(target=resync_loop, args=(exchanges,), daemon=True).start()
+    if COLLECTOR_PUBLISH:
+        threading.Thread(target=publish_loop, daemon=True).start()
+
+    print(f"Collector listening on :{COLLECTOR_PORT}")
+    ThreadingHTTPServer(('0.0.0.0', COLLECTOR_PORT), Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
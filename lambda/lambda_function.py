@@ -1,53 +1,326 @@
+import time
+INIT_STARTED = time.perf_counter()  # 모듈 로드 시작 (import 포함) - 끝은 파일 맨 아래 INIT_SECONDS
+
 import json
 import hmac
 import hashlib
-import time
-import urllib.request
 import urllib.parse
+import urllib.error
+import http.client
+import gzip
+import io
 import base64
+import fcntl
 import os
-import boto3
+import random
+import re
+import threading
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
 
-# DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name='ap-northeast-2')
-snapshots_table = dynamodb.Table('cex-balance-snapshots')
+# cold start/초기화 정보
+RUNTIME = {'invocations': 0, 'loaded_at': time.time(), 'lazy_init': {}}  # lazy_init: 첫 사용 시 초기화한 항목별 소요 시간
+AWS = {}
+AWS_LOCK = threading.Lock()
+
+
+# DynamoDB - boto3 import와 resource 생성은 첫 사용 시 (스냅샷/히스토리 등 DynamoDB를 쓰는 경로에서만)
+# LIVE_CACHE_BACKEND=dynamodb(기본값)면 실시간 잔고 요청도 첫 요청에서 바로 쓰므로 cold start 비용은
+# init에서 첫 요청으로 옮겨갈 뿐 - 그 시간은 runtime.lazy_init_ms로 보고. file 백엔드에서만 실시간 경로에서 빠짐
+def dynamodb():
+    resource = AWS.get('dynamodb')
+    if resource is None:
+        with AWS_LOCK:
+            resource = AWS.get('dynamodb')
+            if resource is None:
+                started = time.perf_counter()
+                import boto3
+                resource = AWS['dynamodb'] = boto3.resource('dynamodb', region_name='ap-northeast-2')
+                RUNTIME['lazy_init']['dynamodb'] = round(time.perf_counter() - started, 3)
+    return resource
+
+
+@lru_cache(maxsize=None)
+def snapshots_table():
+    """레거시: date 키, balances 통째 저장"""
+    return dynamodb().Table('cex-balance-snapshots')
 
-# 가격 캐시
+
+@lru_cache(maxsize=None)
+def snapshot_items_table():
+    """pk/sk 테이블 - pk: 'SNAPSHOT' 또는 'EXCHANGE#<거래소>', sk: '<날짜>#<timestamp>'"""
+    return dynamodb().Table(os.environ.get('SNAPSHOT_ITEMS_TABLE', 'cex-balance-snapshot-items'))
+
+# 가격 캐시 - 모듈 전역이라 warm 컨테이너에서 재사용됨
 PRICES = {}
+PRICE_TIMES = {}  # coin -> 마지막으로 가격을 받은 시각 (epoch)
+PRICE_ORIGINS = {}  # coin -> 가격 출처 거래소
+PRICE_TTL = float(os.environ.get('PRICE_TTL', '60'))  # 이 시간 내면 다운로드 생략
+PRICE_STATE = {'loaded_at': 0, 'held': set()}  # held: 지난 조회의 보유 코인 (다음 조회에서 거래소 조회와 병렬로 갱신)
+PRICE_LOCK = threading.Lock()
+
+STABLECOINS = ['USDT', 'USDC', 'BUSD', 'DAI', 'TUSD', 'FDUSD', 'USD1', 'USDE', 'USD']  # USD: Kraken 등 법정화폐 잔고
+# 한 번도 가격을 못 받았을 때만 쓰는 기본값
+FALLBACK_PRICES = {'BTC': 100000, 'ETH': 3500, 'USDT': 1, 'USDC': 1, 'USD': 1, 'BNB': 700}
+
+
+# targeted: 보유 코인만 symbols=[...]로 조회, full: 전체 티커 다운로드
+PRICE_MODE = os.environ.get('PRICE_MODE', 'targeted')
+PRICE_URL_MAX = 4000  # symbols 파라미터 청크당 URL 최대 길이
+UNLISTED_COINS = set()  # USDT 페어가 없는 코인 (targeted 요청에서 제외)
+
 
-def fetch_prices():
-    """Binance에서 주요 코인 가격 조회"""
-    global PRICES
+def symbol_chunks(coins, max_len=PRICE_URL_MAX):
+    """coin 목록을 URL 길이 제한에 맞는 symbols 쿼리 문자열 목록으로 분할"""
+    chunks = []
+    current = []
+    for coin in sorted(coins):
+        candidate = current + [f'{coin}USDT']
+        query = urllib.parse.urlencode({'symbols': json.dumps(candidate, separators=(',', ':'))})
+        if current and len(query) > max_len:
+            chunks.append(current)
+            current = [f'{coin}USDT']
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return [urllib.parse.urlencode({'symbols': json.dumps(c, separators=(',', ':'))}) for c in chunks]
+
+
+def load_prices(coins=None):
+    """Binance 티커 조회 후 캐시에 병합 (응답에 없는 코인은 마지막 값 유지)
+    
+    coins를 주면 해당 코인만 조회하고, 실패하면 전체 다운로드로 대체
+    """
+    url = 'https://api.binance.com/api/v3/ticker/price'
+    data = None
+    if coins:
+        try:
+            data = []
+            for query in symbol_chunks(coins):
+                data.extend(http_request(f'{url}?{query}', timeout=10))
+        except Exception as e:
+            # 상장 폐지 등으로 잘못된 심볼이 섞이면 400 - 전체 다운로드로 대체
+            print(f"Targeted price fetch error: {e} - falling back to full ticker")
+            data = None
+    full = data is None
+    if full:
+        data = http_request(url, timeout=10)
+    now = time.time()
+    
+    pairs = {}
+    for item in data:
+        pair = split_symbol(item['symbol'])
+        if pair:
+            pairs[pair] = float(item['price'])
+    # USDT 페어 우선, 없으면 USDC/BTC 교차 환산
+    fresh = usd_prices(pairs)
+    
+    # 스테이블코인
+    for coin in STABLECOINS:
+        fresh[coin] = 1.0
+    
+    with PRICE_LOCK:
+        PRICES.update(fresh)
+        PRICE_TIMES.update(dict.fromkeys(fresh, now))
+        PRICE_ORIGINS.update(dict.fromkeys(fresh, 'binance'))
+        if full:
+            PRICE_STATE['loaded_at'] = now
+            if coins:
+                # USDT 직거래 페어가 없는 코인은 targeted 요청에서 제외 (보조 소스가 담당)
+                UNLISTED_COINS.update(set(coins) - {base for base, quote in pairs if quote == 'USDT'})
+    print(f"Loaded {len(fresh)} prices" + ('' if full else ' (targeted)'))
+
+
+def fetch_prices(coins=None):
+    """Binance에서 주요 코인 가격 조회 - TTL 내면 캐시, 지났으면 갱신 (실패하면 이전 가격 유지)
+    
+    coins를 주면 그 중 TTL이 지난 코인만 갱신. 호출 안에서 끝까지 갱신함 - lambda는 응답 후
+    프로세스가 멈추므로 백그라운드 스레드로 넘기지 않고 호출하는 쪽에서 거래소 조회와 병렬로 실행
+    """
+    now = time.time()
+    if coins is None:
+        age = now - PRICE_STATE['loaded_at']
+        has_cache = bool(PRICES)
+    else:
+        coins = {c for c in coins if c not in STABLECOINS and c not in UNLISTED_COINS}
+        coins = {c for c in coins if now - PRICE_TIMES.get(c, 0) >= PRICE_TTL}
+        if not coins:
+            return
+        age = max(now - PRICE_TIMES.get(c, 0) for c in coins)
+        has_cache = all(c in PRICES for c in coins)
+    if age < PRICE_TTL:
+        return
+    
     try:
-        url = 'https://api.binance.com/api/v3/ticker/price'
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-        
-        for item in data:
-            symbol = item['symbol']
-            price = float(item['price'])
-            # USDT 페어만 추출
-            if symbol.endswith('USDT'):
-                coin = symbol[:-4]
-                PRICES[coin] = price
-        
-        # 스테이블코인
-        PRICES['USDT'] = 1.0
-        PRICES['USDC'] = 1.0
-        PRICES['BUSD'] = 1.0
-        PRICES['DAI'] = 1.0
-        PRICES['TUSD'] = 1.0
-        PRICES['FDUSD'] = 1.0
-        PRICES['USD1'] = 1.0
-        PRICES['USDE'] = 1.0
-        
-        print(f"Loaded {len(PRICES)} prices")
+        load_prices(coins)
     except Exception as e:
-        print(f"Price fetch error: {e}")
-        # 기본값
-        PRICES = {'BTC': 100000, 'ETH': 3500, 'USDT': 1, 'USDC': 1, 'BNB': 700}
+        print(f"Price fetch error: {e}" + (f" - serving {age:.0f}s old prices" if has_cache else ''))
+        # 기본값 - 마지막으로 받은 가격은 그대로 두고 없는 코인만 채움
+        with PRICE_LOCK:
+            for coin, price in FALLBACK_PRICES.items():
+                PRICES.setdefault(coin, price)
+
+
+# ============ 보조 가격 소스 ============
+# Binance USDT 페어가 없는 코인만 다른 거래소 공개 티커로 코인별 조회 (앞쪽이 우선, Binance는 load_prices 담당)
+PRICE_SOURCES = ['okx', 'bybit', 'kucoin', 'htx', 'kraken']
+QUOTES = ['USDT', 'USDC', 'USD', 'BTC']  # 긴 것 먼저 (USDT가 USD보다 앞)
+# USD로 끝나지만 USD 페어가 아닌 스테이블 quote (ETHFDUSD를 ETHFD/USD로 읽지 않도록)
+USD_SUFFIX_QUOTES = ('FDUSD', 'TUSD', 'BUSD')
+ORACLE_TTL = float(os.environ.get('ORACLE_TTL', '300'))  # 보조 소스 가격 캐시 (못 찾은 코인도 이 시간 동안 재조회 안 함)
+ORACLE_WORKERS = 8
+ORACLE_BOOK = {}  # coin -> (price, source, fetched_at) - 못 찾으면 price None
+
+# Kraken 자산 코드 (앞의 X/Z 제거 후) → 일반 심볼
+KRAKEN_ASSETS = {'XBT': 'BTC', 'XDG': 'DOGE'}
+KRAKEN_NAMES = {coin: code for code, coin in KRAKEN_ASSETS.items()}
+
+
+def kraken_asset(code):
+    """Kraken 자산 코드 → 일반 심볼 (XXBT → BTC, XETH → ETH, ZUSD → USD, XDG → DOGE)"""
+    if code.startswith(('X', 'Z')) and len(code) == 4:
+        code = code[1:]
+    return KRAKEN_ASSETS.get(code, code)
+
+
+def split_symbol(symbol):
+    """'BTCUSDT' / 'btcusdt' → ('BTC', 'USDT'), 지원하지 않는 quote면 None"""
+    symbol = symbol.upper()
+    for quote in QUOTES:
+        if symbol.endswith(quote) and len(symbol) > len(quote):
+            if quote == 'USD' and symbol.endswith(USD_SUFFIX_QUOTES):
+                return None
+            return symbol[:-len(quote)], quote
+    return None
+
+
+def usd_prices(pairs, btc_usd=None):
+    """{(base, quote): price} → {base: USD 가격} - USDT > USDC > USD > BTC 교차 순"""
+    direct = {}
+    for (base, quote), price in pairs.items():
+        if price <= 0 or quote == 'BTC':
+            continue
+        rank = QUOTES.index(quote)
+        if base not in direct or rank < direct[base][1]:
+            direct[base] = (price, rank)
+    prices = {base: price for base, (price, _) in direct.items()}
+    
+    btc_usd = btc_usd or prices.get('BTC')
+    if btc_usd:
+        for (base, quote), price in pairs.items():
+            if quote == 'BTC' and price > 0 and base not in prices:
+                prices[base] = price * btc_usd
+    return prices
+
+
+# 코인 1개 USDT(Kraken은 USD) 가격 - 상장 안 된 코인이면 None
+def _okx_price(coin):
+    data = http_request(f'https://www.okx.com/api/v5/market/ticker?instId={coin}-USDT', timeout=10)
+    rows = data.get('data') or []
+    return float(rows[0]['last']) if data.get('code') == '0' and rows else None
+
+
+def _bybit_price(coin):
+    data = http_request(f'https://api.bybit.com/v5/market/tickers?category=spot&symbol={coin}USDT', timeout=10)
+    rows = data.get('result', {}).get('list') or []
+    return float(rows[0]['lastPrice']) if data.get('retCode') == 0 and rows else None
+
+
+def _kucoin_price(coin):
+    data = http_request(f'https://api.kucoin.com/api/v1/market/orderbook/level1?symbol={coin}-USDT', timeout=10)
+    tick = data.get('data') or {}
+    return float(tick['price']) if data.get('code') == '200000' and tick.get('price') else None
+
+
+def _htx_price(coin):
+    data = http_request(f'https://api.huobi.pro/market/detail/merged?symbol={coin.lower()}usdt', timeout=10)
+    tick = data.get('tick') or {}
+    return float(tick['close']) if data.get('status') == 'ok' and tick.get('close') else None
+
+
+def _kraken_price(coin):
+    data = http_request(f'https://api.kraken.com/0/public/Ticker?pair={KRAKEN_NAMES.get(coin, coin)}USD', timeout=10)
+    if data.get('error'):
+        return None
+    for t in data.get('result', {}).values():
+        return float(t['c'][0])
+    return None
+
+
+TICKER_SOURCES = {
+    'okx': _okx_price,
+    'bybit': _bybit_price,
+    'kucoin': _kucoin_price,
+    'htx': _htx_price,
+    'kraken': _kraken_price,
+}
+
+
+def oracle_price(coin):
+    """우선순위대로 찾을 때까지 조회 - (price, source, fetched_at), 못 찾으면 price None"""
+    for name in PRICE_SOURCES:
+        try:
+            price = TICKER_SOURCES[name](urllib.parse.quote(coin))
+        except Exception as e:
+            print(f"Price source {name} error for {coin}: {e}")
+            continue
+        if price and price > 0:
+            return price, name, time.time()
+    return None, None, time.time()
+
+
+def fill_prices(coins):
+    """Binance 직거래 가격이 없는 코인을 보조 소스로 채움 - 코인별 결과는 ORACLE_TTL 동안 캐시"""
+    coins = {c for c in coins if c not in STABLECOINS}
+    now = time.time()
+    due = sorted(c for c in coins if now - ORACLE_BOOK.get(c, (None, None, 0))[2] >= ORACLE_TTL)
+    if due:
+        with ThreadPoolExecutor(max_workers=min(ORACLE_WORKERS, len(due)), thread_name_prefix='oracle') as executor:
+            for coin, entry in zip(due, executor.map(oracle_price, due)):
+                ORACLE_BOOK[coin] = entry
+        found = sum(1 for coin in due if ORACLE_BOOK[coin][0])
+        print(f"Oracle prices: {found}/{len(due)} coins")
+    
+    with PRICE_LOCK:
+        for coin in coins:
+            price, source, fetched_at = ORACLE_BOOK.get(coin, (None, None, 0))
+            if price:
+                PRICES[coin] = price
+                PRICE_TIMES[coin] = fetched_at
+                PRICE_ORIGINS[coin] = source
+
+
+def needs_fill(balances):
+    """보조 소스가 필요한 보유 코인 (Binance 가격이 아니거나 Binance USDT 직거래 없음)
+
+    한 번 보조 소스로 채운 코인도 계속 포함 - 갱신 주기는 fill_prices의 ORACLE_TTL이 정함
+    """
+    return {c for c in held_assets(balances) if PRICE_ORIGINS.get(c) != 'binance' or c in UNLISTED_COINS}
+
+
+def held_assets(balances):
+    """잔고 전체에서 기본 코인 집합"""
+    assets = set()
+    for data in balances.values():
+        assets.update(base_asset(coin) for coin in data.get('master', {}))
+        for sub_bal in data.get('subaccounts', {}).values():
+            assets.update(base_asset(coin) for coin in sub_bal)
+    return assets
+
+
+def price_ages(balances):
+    """보유 코인별 가격 나이 (초) - 실시간 가격이 없으면 None"""
+    now = time.time()
+    return {
+        coin: round(now - PRICE_TIMES[coin], 1) if coin in PRICE_TIMES else None
+        for coin in sorted(held_assets(balances))
+    }
+
 
 def get_usd_value(coin, amount, exchange_usd_values=None):
     """코인의 USD 가치 계산"""
@@ -55,59 +328,86 @@ def get_usd_value(coin, amount, exchange_usd_values=None):
     if exchange_usd_values and coin in exchange_usd_values:
         return exchange_usd_values[coin]
     
-    # 접미사 제거 (긴 것 먼저!)
-    base_coin = coin
-    base_coin = base_coin.replace('_DEPOSIT_EARNING', '')  # HTX Earn 먼저
-    base_coin = base_coin.replace('_COIN_FUTURES', '')
-    base_coin = base_coin.replace('_EARN_LOCKED', '')
-    base_coin = base_coin.replace('_SUPER_MARGIN', '')
-    base_coin = base_coin.replace('_FUTURES', '')
-    base_coin = base_coin.replace('_MARGIN', '')
-    base_coin = base_coin.replace('_POINT', '')
-    base_coin = base_coin.replace('_EARN', '')
-    base_coin = base_coin.replace('_FUND', '')
-    base_coin = base_coin.replace('_OTC', '')
-    
-    # HTX Earn: U → USDT
-    if base_coin == 'U':
-        base_coin = 'USDT'
-    
-    price = PRICES.get(base_coin, 0)
+    price = PRICES.get(base_asset(coin), 0)
     return amount * price
 
+
+# 잔고 키 접미사 → 상품 (긴 것 먼저! _EARN_LOCKED가 _EARN보다, _COIN_FUTURES가 _FUTURES보다 앞)
+PRODUCT_SUFFIXES = [
+    ('_DEPOSIT_EARNING', 'deposit_earning'),  # HTX Earn
+    ('_COIN_FUTURES', 'coin_futures'),
+    ('_EARN_LOCKED', 'earn_locked'),
+    ('_SUPER_MARGIN', 'super_margin'),
+    ('_FUTURES', 'futures'),
+    ('_MARGIN', 'margin'),
+    ('_POINT', 'point'),
+    ('_EARN', 'earn'),
+    ('_FUND', 'fund'),
+    ('_OTC', 'otc'),
+]
+# 접미사는 키 끝에서만 매칭
+ASSET_KEY_RE = re.compile(
+    r'^(?P<base>.+?)(?P<suffix>' + '|'.join(re.escape(suf) for suf, _ in PRODUCT_SUFFIXES) + r')?$'
+)
+PRODUCT_BY_SUFFIX = dict(PRODUCT_SUFFIXES)
+ASSET_ALIASES = {'U': 'USDT'}  # HTX Earn: U → USDT
+
+AssetKey = namedtuple('AssetKey', ['base', 'product'])
+
+
+@lru_cache(maxsize=4096)
+def parse_asset_key(coin):
+    """잔고 키 → AssetKey(기본 코인, 상품) 예: 'BTC_COIN_FUTURES' → ('BTC', 'coin_futures')"""
+    match = ASSET_KEY_RE.match(coin)
+    if not match:
+        return AssetKey(coin, 'spot')
+    base = match.group('base')
+    product = PRODUCT_BY_SUFFIX.get(match.group('suffix'), 'spot')
+    return AssetKey(ASSET_ALIASES.get(base, base), product)
+
+
+def base_asset(coin):
+    """잔고 키에서 상품 접미사를 떼어낸 기본 코인"""
+    return parse_asset_key(coin).base
+
+
+def value_balances(bal, direct, quotes):
+    """잔고 dict 하나의 (USD 합계, breakdown) - direct: 코인별 직접 USD 값 (OKX 서브계정)
+    
+    quotes: 코인 키 → (가격, AssetKey) - 평가 한 번 안에서 코인별 가격/키 파싱은 한 번만
+    """
+    total = 0
+    breakdown = {}
+    for coin, amount in bal.items():
+        quote = quotes.get(coin)
+        if quote is None:
+            key = parse_asset_key(coin)
+            quote = quotes[coin] = (PRICES.get(key.base, 0), key)
+        price, key = quote
+        usd = direct[coin] if direct and coin in direct else amount * price
+        total += usd
+        if usd != 0:
+            # UI가 키를 다시 파싱하지 않도록 asset/product 포함
+            breakdown[coin] = {'amount': amount, 'usd': round(usd, 2), 'asset': key.base, 'product': key.product}
+    return total, breakdown
+
+
 def calculate_usd_values(balances):
     """잔고에 USD 가치 추가"""
+    quotes = {}
     for exchange, data in balances.items():
         # OKX 서브계정 직접 USD 값
         direct_sub_usd = data.get('subaccounts_usd_direct', {})
         
         # Master USD 계산 - 항상 가격 기반으로
-        master_usd = 0
-        master_usd_breakdown = {}
-        for coin, amount in data.get('master', {}).items():
-            usd = get_usd_value(coin, amount, None)  # 마스터는 가격 기반
-            master_usd += usd
-            if usd != 0:
-                master_usd_breakdown[coin] = {'amount': amount, 'usd': round(usd, 2)}
+        master_usd, data['master_breakdown'] = value_balances(data.get('master', {}), None, quotes)
         data['master_usd'] = round(master_usd, 2)
-        data['master_breakdown'] = master_usd_breakdown
         
-        # Subaccount USD 계산
+        # Subaccount USD 계산 (OKX 직접 USD 값 우선)
         subaccounts_usd = {}
         total_sub_usd = 0
         for sub_name, sub_bal in data.get('subaccounts', {}).items():
-            sub_usd = 0
-            sub_breakdown = {}
-            sub_direct = direct_sub_usd.get(sub_name, {})
-            for coin, amount in sub_bal.items():
-                # OKX 직접 USD 값 우선 사용
-                if sub_direct and coin in sub_direct:
-                    usd = sub_direct[coin]
-                else:
-                    usd = get_usd_value(coin, amount, None)
-                sub_usd += usd
-                if usd != 0:
-                    sub_breakdown[coin] = {'amount': amount, 'usd': round(usd, 2)}
+            sub_usd, sub_breakdown = value_balances(sub_bal, direct_sub_usd.get(sub_name), quotes)
             subaccounts_usd[sub_name] = {
                 'usd': round(sub_usd, 2),
                 'breakdown': sub_breakdown
@@ -119,195 +419,1802 @@ def calculate_usd_values(balances):
         # 거래소 총 USD
         data['exchange_total_usd'] = round(master_usd + total_sub_usd, 2)
 
-def fetch_all_balances(event):
-    """모든 거래소 잔고 조회"""
-    # 가격 먼저 로드
-    fetch_prices()
-    
-    results = {}
-    errors = {}
+
+# 거래소 병렬 조회 설정
+EXCHANGE_DEADLINE = float(os.environ.get('EXCHANGE_DEADLINE', '25'))  # 거래소별 최대 대기 (초)
+
+# (키, 표시 이름, 필요한 환경변수, fetcher 이름)
+EXCHANGES = [
+    ('binance', 'Binance', 'BINANCE_API_KEY', 'fetch_binance'),
+    ('bybit', 'Bybit', 'BYBIT_API_KEY', 'fetch_bybit'),
+    ('okx', 'OKX', 'OKX_API_KEY', 'fetch_okx'),
+    ('kucoin', 'KuCoin', 'KUCOIN_API_KEY', 'fetch_kucoin'),
+    ('kraken', 'Kraken', 'KRAKEN_API_KEY', 'fetch_kraken'),
+    ('zoomex', 'Zoomex', 'ZOOMEX_API_KEY', 'fetch_zoomex'),
+    ('htx', 'HTX', 'HTX_API_KEY', 'fetch_htx'),
+]
+
+
+def _timed(fn):
+    """fn 실행 후 (결과, 에러, 소요시간) 반환"""
+    started = time.time()
+    try:
+        return fn(), None, time.time() - started
+    except Exception as e:
+        return None, e, time.time() - started
+
+
+def fetch_exchanges_concurrently(deadline=None, only=None):
+    """설정된 거래소를 동시에 조회 - (results, errors, timings) 반환 (only: 조회할 거래소 키)"""
+    deadline = deadline or EXCHANGE_DEADLINE
+    results = {}
+    errors = {}
+    timings = {}
+    
+    jobs = [(key, label, globals()[fn_name]) for key, label, env_key, fn_name in EXCHANGES
+            if os.environ.get(env_key) and (only is None or key in only)]
+    if not jobs:
+        return results, errors, timings
+    
+    # 모든 거래소가 동시에 시작하므로 제출 시점 기준 대기 = 거래소별 deadline
+    executor = ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix='fetch')
+    started = time.time()
+    futures = {executor.submit(_timed, fn): (key, label) for key, label, fn in jobs}
+    done, not_done = wait(futures, timeout=deadline)
+    
+    for future in done:
+        key, label = futures[future]
+        data, error, elapsed = future.result()
+        timings[key] = round(elapsed, 3)
+        if error is None:
+            results[key] = data
+            print(f"✓ {label}: {len(data.get('total', {}))} assets ({elapsed:.2f}s)")
+        else:
+            errors[key] = str(error)
+            print(f"✗ {label}: {error}")
+    
+    for future in not_done:
+        key, label = futures[future]
+        future.cancel()
+        errors[key] = f'timeout after {deadline}s'
+        timings[key] = round(time.time() - started, 3)
+        print(f"✗ {label}: timeout after {deadline}s")
+    
+    # 타임아웃된 스레드는 기다리지 않음 (Lambda 응답 지연 방지)
+    executor.shutdown(wait=False)
+    return results, errors, timings
+
+
+# ============ SCHEDULER ============
+# 거래소별로 갱신 주기가 된 것만 조회, 나머지는 마지막 결과 재사용
+ADAPTIVE_REFRESH = os.environ.get('ADAPTIVE_REFRESH', '1') == '1'
+# 거래소별 기본 갱신 주기 (초) - 변동이 없으면 최대 REFRESH_BACKOFF_MAX배까지 늘어남
+REFRESH_INTERVALS = {
+    'binance': 30, 'bybit': 30, 'okx': 60, 'kucoin': 120, 'htx': 120, 'kraken': 300, 'zoomex': 300,
+    **json.loads(os.environ.get('REFRESH_INTERVALS', '{}')),
+}
+REFRESH_BACKOFF_MAX = 8
+
+
+def next_interval(exchange, state, changed):
+    """변동 있으면 주기 절반 (기본값까지), 없으면 두 배 (기본값 × REFRESH_BACKOFF_MAX까지)"""
+    base = REFRESH_INTERVALS.get(exchange, 60)
+    current = state['interval'] if state else base
+    if changed:
+        return max(base, current / 2)
+    return min(current * 2, base * REFRESH_BACKOFF_MAX)
+
+
+def fingerprint(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def patch_partial(data, previous):
+    """실패한 서브계정은 이전 조회 값으로 대체 - 합계에서 빠지거나 일부만 더해지지 않도록
+
+    대체한 서브계정 이름 목록 반환 (data['stale_accounts']에도 기록)
+    """
+    prev_subs = previous.get('subaccounts', {})
+    failed = data.get('failed', [])
+    # 서브계정 목록 자체가 실패하면 이전에 있던 서브계정 전부
+    names = [name for name in prev_subs if name not in data['subaccounts']] if 'subaccounts' in failed else failed
+    stale = []
+    for name in names:
+        if name not in prev_subs:
+            continue
+        for ccy, amt in data['subaccounts'].get(name, {}).items():
+            data['total'][ccy] = data['total'].get(ccy, 0) - amt
+        for ccy, amt in prev_subs[name].items():
+            data['total'][ccy] = data['total'].get(ccy, 0) + amt
+        data['subaccounts'][name] = prev_subs[name]
+        # OKX: 서브계정 USD 직접값도 같이
+        prev_usd = previous.get('subaccounts_usd_direct', {}).get(name)
+        if prev_usd is not None:
+            data.setdefault('subaccounts_usd_direct', {})[name] = prev_usd
+            usd_values = data.setdefault('usd_values', {})
+            for ccy, usd in prev_usd.items():
+                usd_values[ccy] = usd_values.get(ccy, 0) + usd
+        stale.append(name)
+    if stale:
+        data['stale_accounts'] = stale
+    return stale
+
+
+def fetch_sections(full=False):
+    """주기가 된 거래소만 조회하고 나머지는 캐시된 결과로 채움 - full이면 전부 조회
+    
+    (results, errors, timings, freshness) 반환
+    """
+    if not ADAPTIVE_REFRESH:
+        results, errors, timings = fetch_exchanges_concurrently()
+        return results, errors, timings, {}
+    
+    configured = [key for key, _, env_key, _ in EXCHANGES if os.environ.get(env_key)]
+    now = time.time()
+    states = {}
+    for key in configured:
+        try:
+            cached = LIVE_CACHE.get(f'section#{key}')
+        except Exception as e:
+            print(f"Section cache get error ({key}): {e}")
+            cached = None
+        if cached:
+            states[key] = cached[0]
+    
+    due = {key for key in configured
+           if full or key not in states or now - states[key]['fetched_at'] >= states[key]['interval']}
+    results, errors, timings = fetch_exchanges_concurrently(only=due)
+    
+    freshness = {}
+    for key in configured:
+        state = states.get(key)
+        if key in results:
+            if state and results[key].get('failed'):
+                patched = patch_partial(results[key], state['data'])
+                if patched:
+                    print(f"{key}: using previous balances for failed accounts {', '.join(patched)}")
+            fp = fingerprint(results[key])
+            changed = state is None or state.get('fingerprint') != fp
+            state = {
+                'data': results[key],
+                'fetched_at': now,
+                'fingerprint': fp,
+                'interval': next_interval(key, state, changed),
+            }
+            try:
+                LIVE_CACHE.put(f'section#{key}', state, versioned=False)
+            except Exception as e:
+                print(f"Section cache put error ({key}): {e}")
+            source = 'fresh'
+        elif state:
+            # 주기 전이거나 조회 실패 - 마지막 결과 사용
+            results[key] = state['data']
+            source = 'stale' if key in errors else 'cached'
+        else:
+            continue
+        freshness[key] = {
+            'fetched_at': datetime.fromtimestamp(state['fetched_at'], timezone.utc).isoformat(),
+            'age': round(time.time() - state['fetched_at'], 1),
+            'interval': state['interval'],
+            'source': source,
+        }
+    
+    skipped = sorted(set(configured) - due)
+    if skipped:
+        print(f"Not due, using cached: {', '.join(skipped)}")
+    return results, errors, timings, freshness
+
+
+def collect_balances(full=False):
+    """모든 거래소 잔고 + 가격 조회 후 응답 dict 생성 (full이면 주기 무시하고 전부 조회)"""
+    started = time.time()
+    
+    # 가격은 거래소 조회와 병렬로 갱신 - full: 전체 티커, targeted: 지난 조회의 보유 코인
+    if PRICE_MODE == 'targeted':
+        held = PRICE_STATE['held']
+        refresh = (lambda: fetch_prices(held)) if held else None
+    else:
+        refresh = fetch_prices
+    price_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='prices')
+    price_future = price_executor.submit(_timed, refresh) if refresh else None
+    
+    results, errors, timings, freshness = fetch_sections(full)
+    
+    if price_future is not None:
+        try:
+            _, error, elapsed = price_future.result(timeout=EXCHANGE_DEADLINE)
+            timings['prices'] = round(elapsed, 3)
+            if error is not None:
+                print(f"Price fetch error: {error}")
+        except Exception as e:
+            print(f"Price fetch wait error: {e}")
+    price_executor.shutdown(wait=False)
+    
+    if PRICE_MODE == 'targeted':
+        # 새로 생긴 보유 코인만 남음 (병렬로 갱신한 코인은 TTL 안)
+        held = PRICE_STATE['held'] = held_assets(results)
+        _, error, elapsed = _timed(lambda: fetch_prices(held))
+        timings['prices'] = round(timings.get('prices', 0) + elapsed, 3)
+        if error is not None:
+            print(f"Price fetch error: {error}")
+    
+    # Binance에 없는 코인은 다른 거래소 티커로 보충
+    fill = needs_fill(results)
+    if fill:
+        _, error, elapsed = _timed(lambda: fill_prices(fill))
+        timings['price_fill'] = round(elapsed, 3)
+        if error is not None:
+            print(f"Price fill error: {error}")
+    
+    # USD 가치 계산
+    with phase('valuation'):
+        calculate_usd_values(results)
+    
+    # 전체 총합
+    grand_total_usd = sum(data.get('exchange_total_usd', 0) for data in results.values())
+    
+    # 일부 계정 실패 / 이전 결과 사용 / 차단기 상태 - 합계가 완전하지 않으면 표시
+    # partial: 합계에서 빠진 계정, stale_accounts: 이전 조회 값으로 채운 계정
+    partial = {}
+    stale_accounts = {}
+    dormant = {key: len(data['dormant']) for key, data in results.items() if data.get('dormant')}
+    for key, data in results.items():
+        patched = data.get('stale_accounts', [])
+        missing = [name for name in data.get('failed', []) if name not in patched]
+        if missing:
+            partial[key] = missing
+        if patched:
+            stale_accounts[key] = patched
+    stale = sorted(key for key, info in freshness.items() if info['source'] == 'stale')
+    circuits = {key: breaker.state() for key, breaker in BREAKERS.items() if breaker.state() != 'closed'}
+    
+    response = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'grand_total_usd': round(grand_total_usd, 2),
+        'balances': results,
+        'errors': errors if errors else None,
+        'timings': {**timings, 'total': round(time.time() - started, 3)},
+        'price_ages': price_ages(results),
+        'unpriced_assets': sorted(c for c in held_assets(results) if not PRICES.get(c)),
+        'freshness': freshness,
+        'complete': not errors and not partial and not stale and not stale_accounts,
+        'partial': partial or None,
+        'stale': stale or None,
+        'stale_accounts': stale_accounts or None,
+        'dormant_accounts': dormant or None,  # 휴면이라 건너뛴 서브계정 수 (마지막 조회에서 잔고 없음)
+        'circuits': circuits or None
+    }
+    return response
+
+
+def fetch_all_balances(event):
+    """모든 거래소 잔고 조회 - 짧은 TTL 캐시 + 동시 요청 병합"""
+    params = event.get('queryStringParameters') or {}
+    # 스케줄 트리거 (EventBridge)면 스냅샷 저장
+    snapshot = event.get('source') == 'aws.events' or event.get('save_snapshot')
+    
+    scope = live_scope(event)
+    if scope is None:
+        return error_response(event, 400, f"invalid scope: {params.get('scope')}")
+    
+    # 스냅샷은 캐시를 읽지 않음, 클라이언트의 ?fresh=1은 LIVE_FRESH_MIN_AGE보다 새 결과가 있으면 그대로 (결과는 캐시에 기록)
+    fresh = bool(snapshot) or params.get('fresh') == '1'
+    response, cache_info = cached_live_response(
+        scope,
+        lambda: collect_balances(full=fresh),
+        force=fresh,
+        min_age=0 if snapshot else LIVE_FRESH_MIN_AGE
+    )
+    
+    if snapshot:
+        with phase('dynamodb_write'):
+            save_snapshot(response)
+    
+    # 요청 단위 정보 (캐시 상태, cold start, 계측 요약)
+    extra = {'cache': cache_info, 'runtime': runtime_info()}
+    if METRICS is not None:
+        extra['metrics'] = METRICS.summary()
+    
+    # ?since=<version>: 클라이언트가 가진 버전 대비 변경분만
+    version = response['timestamp']
+    since = params.get('since')
+    if since and since == version:
+        return json_response(event, {'version': version, 'unchanged': True, **extra})
+    if since:
+        try:
+            base = LIVE_CACHE.get_version(scope, since)
+        except Exception as e:
+            print(f"Live version lookup error: {e}")
+            base = None
+        if base is not None:
+            return json_response(event, {**live_delta(response, base, since), 'version': version, **extra})
+    
+    return json_response(event, {**response, 'version': version, **extra})
+
+
+def live_delta(response, base_balances, since):
+    """이전 버전 balances 대비 변경/추가/삭제된 경로만 담은 응답 (합계 등 나머지 필드는 그대로)"""
+    delta = diff_flat(flatten_tree(base_balances), flatten_tree(response['balances']))
+    payload = {key: value for key, value in response.items() if key != 'balances'}
+    payload['base_version'] = since
+    payload['delta'] = delta
+    return payload
+
+
+# ============ LIVE CACHE ============
+# 대시보드 여러 개가 동시에 열려 있어도 거래소 API는 TTL당 한 번만 호출
+LIVE_CACHE_TTL = float(os.environ.get('LIVE_CACHE_TTL', '30'))  # 0이면 캐시 끔
+LIVE_CACHE_BACKEND = os.environ.get('LIVE_CACHE_BACKEND', 'dynamodb')  # dynamodb | file
+LIVE_CACHE_FILE = os.environ.get('LIVE_CACHE_FILE', '/tmp/cex-live-cache.json')
+LIVE_LEASE_SECONDS = 60  # 조회 담당 lease 만료 (조회 중 죽은 경우 대비)
+LIVE_WAIT_SECONDS = float(os.environ.get('LIVE_WAIT_SECONDS', '30'))  # 다른 요청의 조회 결과를 기다리는 최대 시간
+LIVE_VERSION_TTL = 600  # delta 기준으로 보관하는 이전 버전 유지 시간 (DynamoDB TTL 속성 expires_at)
+LIVE_VERSIONS = 10  # 파일 캐시가 보관하는 이전 버전 수
+LIVE_SCOPES = {'all'}  # 허용하는 scope - 임의 scope로 새 캐시/lease 아이템과 조회를 만들지 않도록
+LIVE_FRESH_MIN_AGE = float(os.environ.get('LIVE_FRESH_MIN_AGE', '10'))  # ?fresh=1이어도 이보다 새 결과는 그대로 사용
+
+INFLIGHT = {}  # scope -> {'event', 'result'} - 같은 프로세스 내 진행 중 조회
+INFLIGHT_LOCK = threading.Lock()
+
+
+def live_scope(event):
+    """캐시 키 - 현재는 전체 조회만 있으므로 'all' (허용되지 않은 scope면 None)"""
+    scope = (event.get('queryStringParameters') or {}).get('scope', 'all')
+    return scope if scope in LIVE_SCOPES else None
+
+
+class DynamoLiveCache:
+    """snapshot_items_table의 LIVE#<scope> 아이템 - result(결과), lease(조회 담당)"""
+    
+    def get(self, scope):
+        item = snapshot_items_table().get_item(Key={'pk': f'LIVE#{scope}', 'sk': 'result'}).get('Item')
+        if not item:
+            return None
+        return unpack(item['data']), float(item['stored_at'])
+    
+    def put(self, scope, response, versioned=True):
+        with snapshot_items_table().batch_writer() as batch:
+            batch.put_item(Item={
+                'pk': f'LIVE#{scope}',
+                'sk': 'result',
+                'stored_at': str(time.time()),
+                'data': pack(response),
+            })
+            if not versioned:
+                return
+            # delta 응답용 버전별 balances (테이블 TTL로 자동 삭제)
+            batch.put_item(Item={
+                'pk': f'LIVE#{scope}',
+                'sk': f"v#{response['timestamp']}",
+                'expires_at': int(time.time() + LIVE_VERSION_TTL),
+                'data': pack(response['balances']),
+            })
+    
+    def get_version(self, scope, version):
+        item = snapshot_items_table().get_item(Key={'pk': f'LIVE#{scope}', 'sk': f'v#{version}'}).get('Item')
+        if not item or int(item.get('expires_at', 0)) < time.time():
+            return None
+        return unpack(item['data'])
+    
+    def acquire(self, scope):
+        """조회 담당 lease 획득 - 다른 요청이 이미 조회 중이면 False"""
+        from boto3.dynamodb.conditions import Attr
+        now = int(time.time())
+        try:
+            snapshot_items_table().put_item(
+                Item={'pk': f'LIVE#{scope}', 'sk': 'lease', 'expires': now + LIVE_LEASE_SECONDS},
+                ConditionExpression=Attr('pk').not_exists() | Attr('expires').lt(now)
+            )
+            return True
+        except snapshot_items_table().meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+    
+    def release(self, scope):
+        snapshot_items_table().delete_item(Key={'pk': f'LIVE#{scope}', 'sk': 'lease'})
+
+
+class FileLiveCache:
+    """로컬 JSON 파일 캐시 (테스트/데몬용) - flock으로 프로세스 간 lease"""
+    
+    def __init__(self, path=LIVE_CACHE_FILE):
+        self.path = path
+    
+    def _update(self, fn):
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            raw = f.read()
+            state = json.loads(raw) if raw else {}
+            result = fn(state)
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            return result
+    
+    def get(self, scope):
+        entry = self._update(lambda state: state.get(scope, {}).get('result'))
+        return (entry['response'], entry['stored_at']) if entry else None
+    
+    def put(self, scope, response, versioned=True):
+        def write(state):
+            entry = state.setdefault(scope, {})
+            entry['result'] = {'response': response, 'stored_at': time.time()}
+            if not versioned:
+                return
+            versions = entry.setdefault('versions', {})
+            versions[response['timestamp']] = response['balances']
+            for old in sorted(versions)[:-LIVE_VERSIONS]:
+                del versions[old]
+        self._update(write)
+    
+    def get_version(self, scope, version):
+        return self._update(lambda state: state.get(scope, {}).get('versions', {}).get(version))
+    
+    def acquire(self, scope):
+        def take(state):
+            entry = state.setdefault(scope, {})
+            if entry.get('lease_expires', 0) > time.time():
+                return False
+            entry['lease_expires'] = time.time() + LIVE_LEASE_SECONDS
+            return True
+        return self._update(take)
+    
+    def release(self, scope):
+        self._update(lambda state: state.get(scope, {}).pop('lease_expires', None))
+
+
+LIVE_CACHE = FileLiveCache() if LIVE_CACHE_BACKEND == 'file' else DynamoLiveCache()
+
+
+def _compute_shared(scope, compute):
+    """다른 컨테이너와 lease로 조회 병합 - lease를 못 얻으면 담당자의 결과를 기다림"""
+    started = time.time()
+    try:
+        leader = LIVE_CACHE.acquire(scope)
+    except Exception as e:
+        print(f"Live cache lease error: {e}")
+        leader = True
+    
+    if not leader:
+        while time.time() - started < LIVE_WAIT_SECONDS:
+            time.sleep(0.5)
+            cached = LIVE_CACHE.get(scope)
+            if cached and cached[1] >= started:
+                return cached[0], 'coalesced'
+        print(f"Live cache wait timeout for {scope} - fetching directly")
+    
+    try:
+        response = compute()
+        try:
+            LIVE_CACHE.put(scope, response)
+        except Exception as e:
+            print(f"Live cache put error: {e}")
+        return response, 'miss'
+    finally:
+        if leader:
+            try:
+                LIVE_CACHE.release(scope)
+            except Exception as e:
+                print(f"Live cache release error: {e}")
+
+
+def cached_live_response(scope, compute, force=False, min_age=0):
+    """TTL 캐시 조회 → 없으면 (같은 프로세스/다른 컨테이너 요청과 병합해서) 새로 조회
+    
+    force면 TTL 대신 min_age보다 새 결과만 사용 (0이면 캐시를 읽지 않음). (response, cache_info) 반환
+    """
+    if LIVE_CACHE_TTL <= 0:
+        return compute(), {'scope': scope, 'status': 'disabled'}
+    
+    max_age = min_age if force else LIVE_CACHE_TTL
+    if max_age > 0:
+        try:
+            cached = LIVE_CACHE.get(scope)
+        except Exception as e:
+            print(f"Live cache get error: {e}")
+            cached = None
+        if cached and time.time() - cached[1] < max_age:
+            return cached[0], {'scope': scope, 'status': 'hit', 'age': round(time.time() - cached[1], 1)}
+    
+    # 같은 프로세스 내 동시 요청은 진행 중인 조회 결과를 공유
+    with INFLIGHT_LOCK:
+        entry = INFLIGHT.get(scope)
+        leader = entry is None
+        if leader:
+            entry = INFLIGHT[scope] = {'event': threading.Event(), 'result': None}
+    
+    if not leader:
+        entry['event'].wait(LIVE_WAIT_SECONDS)
+        if entry['result'] is not None:
+            return entry['result'][0], {'scope': scope, 'status': 'coalesced', 'age': 0}
+        return compute(), {'scope': scope, 'status': 'miss', 'age': 0}
+    
+    try:
+        response, status = _compute_shared(scope, compute)
+        entry['result'] = (response, status)
+        return response, {'scope': scope, 'status': status, 'age': 0}
+    finally:
+        entry['event'].set()
+        with INFLIGHT_LOCK:
+            INFLIGHT.pop(scope, None)
+
+
+# ============ SNAPSHOTS ============
+SNAPSHOT_KEYFRAME_EVERY = int(os.environ.get('SNAPSHOT_KEYFRAME_EVERY', '24'))  # delta 이만큼 쌓이면 전체 저장
+SNAPSHOT_STATE = {}  # exchange -> {'flat', 'sk', 'chain'} - 마지막 저장 상태 (warm 컨테이너 재사용)
+SGT = timezone(timedelta(hours=8))  # 스냅샷 날짜 기준: 싱가폴 시간 (UTC+8)
+
+
+def flatten_tree(tree, prefix=()):
+    """중첩 dict → {경로 tuple: 값} (빈 dict도 값으로 유지)"""
+    flat = {}
+    for key, value in tree.items():
+        path = prefix + (key,)
+        if isinstance(value, dict) and value:
+            flat.update(flatten_tree(value, path))
+        else:
+            flat[path] = value
+    return flat
+
+
+def unflatten_tree(flat):
+    tree = {}
+    for path, value in flat.items():
+        node = tree
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        node[path[-1]] = value
+    return tree
+
+
+def diff_flat(prev, cur):
+    """두 flat 상태의 차이 - 변경/추가된 경로와 삭제된 경로"""
+    return {
+        'set': [[list(path), value] for path, value in cur.items() if path not in prev or prev[path] != value],
+        'del': [list(path) for path in prev if path not in cur],
+    }
+
+
+def apply_delta(flat, delta):
+    for path in delta['del']:
+        flat.pop(tuple(path), None)
+    for path, value in delta['set']:
+        flat[tuple(path)] = value
+    return flat
+
+
+def pack(obj):
+    """JSON + zlib 압축 (DynamoDB Binary)"""
+    return zlib.compress(json.dumps(obj, separators=(',', ':')).encode())
+
+
+def unpack(raw):
+    return json.loads(zlib.decompress(bytes(getattr(raw, 'value', raw))))
+
+
+def query_all(table, **kwargs):
+    """Query 페이지 끝까지 순회"""
+    while True:
+        response = table.query(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def replay_exchange(exchange, sks):
+    """sks(오름차순) 각 시점의 거래소 상태 복원 - 직전 keyframe부터 delta 적용"""
+    from boto3.dynamodb.conditions import Key
+    items = []
+    for item in query_all(snapshot_items_table(),
+                          KeyConditionExpression=Key('pk').eq(f'EXCHANGE#{exchange}') & Key('sk').lte(sks[-1]),
+                          ScanIndexForward=False):
+        items.append(item)
+        if item['kind'] == 'full' and item['sk'] <= sks[0]:
+            break
+    items.reverse()
+    
+    states = {}
+    flat = None
+    chain = 0
+    targets = iter(sks)
+    target = next(targets, None)
+    for i, item in enumerate(items):
+        payload = unpack(item['data'])
+        if item['kind'] == 'full':
+            flat = {tuple(path): value for path, value in payload}
+            chain = 0
+        elif flat is not None:
+            apply_delta(flat, payload)
+            chain += 1
+        next_sk = items[i + 1]['sk'] if i + 1 < len(items) else None
+        # 다음 아이템 전까지의 시점은 모두 이 상태
+        while target is not None and (next_sk is None or target < next_sk):
+            if target >= item['sk'] and flat is not None:
+                states[target] = (dict(flat), item['sk'], chain)
+            target = next(targets, None)
+    return states
+
+
+def latest_exchange_sk(exchange):
+    """EXCHANGE#<거래소>의 가장 최근 아이템 sk (없으면 None)"""
+    from boto3.dynamodb.conditions import Key
+    items = snapshot_items_table().query(
+        KeyConditionExpression=Key('pk').eq(f'EXCHANGE#{exchange}'),
+        ScanIndexForward=False,
+        Limit=1,
+        ProjectionExpression='sk'
+    ).get('Items', [])
+    return items[0]['sk'] if items else None
+
+
+def exchange_state(exchange):
+    """delta 기준이 될 최신 저장 상태 - 메모리에 없거나 최신 아이템이 아니면 (다른 컨테이너가 저장) DynamoDB에서 복원"""
+    cached = SNAPSHOT_STATE.get(exchange)
+    if cached is not None and cached['sk'] != latest_exchange_sk(exchange):
+        print(f"Snapshot base for {exchange} is not the latest item - reloading")
+        cached = None
+    if cached is None:
+        states = replay_exchange(exchange, ['~'])  # '~'는 모든 날짜 sk보다 큼
+        flat, sk, chain = states.get('~', (None, None, 0))
+        SNAPSHOT_STATE[exchange] = {'flat': flat, 'sk': sk, 'chain': chain}
+    return SNAPSHOT_STATE[exchange]
+
+
+def save_snapshot(data):
+    """DynamoDB에 스냅샷 저장 - 거래소별 압축 아이템, 이전 스냅샷 대비 delta만 기록"""
+    # 싱가폴 시간 (UTC+8)
+    now_sgt = datetime.now(SGT)
+    try:
+        date_str = now_sgt.strftime('%Y-%m-%d')
+        sk = f"{date_str}#{data['timestamp']}"
+        
+        exchanges = {}
+        saved = {}
+        with snapshot_items_table().batch_writer() as batch:
+            for exchange, ex_data in data['balances'].items():
+                flat = flatten_tree(ex_data)
+                state = exchange_state(exchange)
+                
+                kind = 'full'
+                if state['flat'] is not None and state['chain'] < SNAPSHOT_KEYFRAME_EVERY:
+                    delta = diff_flat(state['flat'], flat)
+                    kind = 'delta' if delta['set'] or delta['del'] else 'same'
+                
+                if kind == 'full':
+                    payload = pack([[list(path), value] for path, value in flat.items()])
+                elif kind == 'delta':
+                    payload = pack(delta)
+                
+                # 변경 없으면 아이템을 쓰지 않음 - 이전 상태가 그대로 유효
+                if kind != 'same':
+                    batch.put_item(Item={'pk': f'EXCHANGE#{exchange}', 'sk': sk, 'kind': kind, 'data': payload})
+                    saved[exchange] = {
+                        'flat': flat,
+                        'sk': sk,
+                        'chain': 0 if kind == 'full' else state['chain'] + 1,
+                    }
+                exchanges[exchange] = {'total_usd': ex_data.get('exchange_total_usd', 0), 'kind': kind}
+            
+            batch.put_item(Item={
+                'pk': 'SNAPSHOT',
+                'sk': sk,
+                'date': date_str,
+                'timestamp': data['timestamp'],
+                'grand_total_usd': str(data['grand_total_usd']),
+                'exchanges': json.dumps(exchanges),
+            })
+        
+        # batch가 flush된 뒤에만 기준 상태를 옮김 (저장 안 된 상태를 기준으로 delta를 만들지 않도록)
+        SNAPSHOT_STATE.update(saved)
+        kinds = ', '.join(f"{ex}={info['kind']}" for ex, info in exchanges.items())
+        print(f"Snapshot saved: {sk} ({kinds})")
+    except Exception as e:
+        print(f"Snapshot save error: {e}")
+        # 일부만 기록됐을 수 있음 - 다음 저장은 DynamoDB에서 기준 상태를 다시 복원
+        SNAPSHOT_STATE.clear()
+        # 히스토리에 없는 합계가 롤업에 들어가지 않도록 롤업도 건너뜀
+        return
+    
+    try:
+        update_rollups(now_sgt, data)
+    except Exception as e:
+        print(f"Rollup update error: {e}")
+
+
+# ============ ROLLUPS ============
+ROLLUP_PERIODS = {
+    'day': lambda d: d.strftime('%Y-%m-%d'),
+    'week': lambda d: '%d-W%02d' % d.isocalendar()[:2],
+    'month': lambda d: d.strftime('%Y-%m'),
+}
+
+
+def asset_totals(balances):
+    """기본 코인별 USD 합계 (전 거래소, 마스터 + 서브계정)"""
+    totals = {}
+    for data in balances.values():
+        breakdowns = [data.get('master_breakdown', {})]
+        breakdowns += [sub.get('breakdown', {}) for sub in data.get('subaccounts_usd', {}).values()]
+        for breakdown in breakdowns:
+            for coin, info in breakdown.items():
+                asset = info.get('asset') or base_asset(coin)
+                totals[asset] = totals.get(asset, 0) + info['usd']
+    return {asset: round(usd, 2) for asset, usd in totals.items()}
+
+
+def merge_stat(stat, value):
+    """min/max/last 집계에 값 하나 반영"""
+    if not stat:
+        return {'min': value, 'max': value, 'last': value, 'count': 1}
+    return {
+        'min': min(stat['min'], value),
+        'max': max(stat['max'], value),
+        'last': value,
+        'count': stat['count'] + 1,
+    }
+
+
+def update_rollups(when, data):
+    """일/주/월 집계 갱신 - 전체, 거래소별, 코인별 min/max/last"""
+    exchange_totals = {ex: d.get('exchange_total_usd', 0) for ex, d in data['balances'].items()}
+    assets = asset_totals(data['balances'])
+    
+    with snapshot_items_table().batch_writer() as batch:
+        for period, key_of in ROLLUP_PERIODS.items():
+            key = {'pk': f'ROLLUP#{period}', 'sk': key_of(when)}
+            item = snapshot_items_table().get_item(Key=key).get('Item')
+            rollup = unpack(item['data']) if item else {'total': None, 'exchanges': {}, 'assets': {}}
+            
+            rollup['total'] = merge_stat(rollup['total'], data['grand_total_usd'])
+            for exchange, total in exchange_totals.items():
+                rollup['exchanges'][exchange] = merge_stat(rollup['exchanges'].get(exchange), total)
+            for asset, usd in assets.items():
+                rollup['assets'][asset] = merge_stat(rollup['assets'].get(asset), usd)
+            rollup['updated_at'] = data['timestamp']
+            
+            batch.put_item(Item={**key, 'data': pack(rollup)})
+
+
+def get_rollups(period='day', start=None, end=None, with_assets=False):
+    """집계 조회 - period 키 범위 (예: day는 '2026-01-01'~'2026-12-31'), 오래된 순"""
+    from boto3.dynamodb.conditions import Key
+    condition = Key('pk').eq(f'ROLLUP#{period}')
+    if start and end:
+        condition = condition & Key('sk').between(start, end)
+    elif start:
+        condition = condition & Key('sk').gte(start)
+    elif end:
+        condition = condition & Key('sk').lte(end)
+    
+    rollups = []
+    for item in query_all(snapshot_items_table(), KeyConditionExpression=condition):
+        rollup = unpack(item['data'])
+        if not with_assets:
+            rollup.pop('assets', None)
+        rollups.append({'period': item['sk'], **rollup})
+    return rollups
+
+
+def load_snapshots(metas):
+    """스냅샷 메타 아이템 목록의 balances 복원 - 거래소별로 한 번씩만 query"""
+    by_exchange = {}
+    for meta in metas:
+        for exchange in json.loads(meta['exchanges']):
+            by_exchange.setdefault(exchange, []).append(meta['sk'])
+    
+    states = {exchange: replay_exchange(exchange, sorted(sks)) for exchange, sks in by_exchange.items()}
+    
+    snapshots = []
+    for meta in metas:
+        balances = {}
+        for exchange in json.loads(meta['exchanges']):
+            state = states[exchange].get(meta['sk'])
+            if state:
+                balances[exchange] = unflatten_tree(state[0])
+        snapshots.append({
+            'date': meta['date'],
+            'timestamp': meta['timestamp'],
+            'grand_total_usd': float(meta['grand_total_usd']),
+            'balances': balances,
+        })
+    return snapshots
+
+
+def get_legacy_snapshots(dates, totals_only=False):
+    """레거시 테이블(date 키)에서 날짜 목록을 키로 직접 조회 (BatchGetItem, 100개씩)"""
+    request = {}
+    if totals_only:
+        # balances blob은 읽지 않음
+        request = {
+            'ProjectionExpression': '#d, #t, grand_total_usd',
+            'ExpressionAttributeNames': {'#d': 'date', '#t': 'timestamp'},
+        }
+    items = []
+    dates = list(dates)
+    for i in range(0, len(dates), 100):
+        pending = {snapshots_table().name: {'Keys': [{'date': d} for d in dates[i:i + 100]], **request}}
+        while pending:
+            response = dynamodb().batch_get_item(RequestItems=pending)
+            items.extend(response.get('Responses', {}).get(snapshots_table().name, []))
+            pending = response.get('UnprocessedKeys') or None
+    
+    snapshots = []
+    for item in items:
+        snapshot = {
+            'date': item['date'],
+            'timestamp': item['timestamp'],
+            'grand_total_usd': float(item['grand_total_usd']),
+        }
+        if not totals_only:
+            snapshot['balances'] = json.loads(item['balances'])
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def get_snapshots(limit=30, start=None, end=None, totals_only=False):
+    """스냅샷 조회 - start~end (SGT 날짜, 포함) 범위의 날짜별 마지막 스냅샷, 최신순 (조회 실패는 예외)
+    
+    totals_only면 balances 없이 합계(grand_total_usd, exchange_totals)만 반환 (차트용)
+    """
+    from boto3.dynamodb.conditions import Key
+    end = end or datetime.now(SGT).strftime('%Y-%m-%d')
+    
+    # 새 형식: 범위 query (start 없으면 end 이전 전체), 최신순으로 날짜별 첫 (= 마지막) 스냅샷만
+    condition = Key('pk').eq('SNAPSHOT') & (
+        Key('sk').between(f'{start}#', f'{end}#~') if start else Key('sk').lte(f'{end}#~')
+    )
+    metas = []
+    seen = set()
+    for meta in query_all(snapshot_items_table(), KeyConditionExpression=condition, ScanIndexForward=False):
+        if meta['date'] not in seen:
+            seen.add(meta['date'])
+            metas.append(meta)
+            if len(metas) >= limit:
+                break
+    
+    if totals_only:
+        snapshots = [{
+            'date': meta['date'],
+            'timestamp': meta['timestamp'],
+            'grand_total_usd': float(meta['grand_total_usd']),
+            'exchange_totals': {ex: info['total_usd'] for ex, info in json.loads(meta['exchanges']).items()},
+        } for meta in metas]
+    else:
+        snapshots = load_snapshots(metas)
+    
+    # 레거시 테이블 (새 형식이 없는 날짜만, 날짜 키라 범위를 열거해서 조회)
+    if len(snapshots) < limit:
+        start = start or (datetime.strptime(end, '%Y-%m-%d') - timedelta(days=limit - 1)).strftime('%Y-%m-%d')
+        day = datetime.strptime(start, '%Y-%m-%d')
+        last = datetime.strptime(end, '%Y-%m-%d')
+        missing = []
+        while day <= last:
+            if day.strftime('%Y-%m-%d') not in seen:
+                missing.append(day.strftime('%Y-%m-%d'))
+            day += timedelta(days=1)
+        snapshots.extend(get_legacy_snapshots(missing, totals_only))
+    
+    # 날짜 역순 정렬
+    snapshots.sort(key=lambda x: x['date'], reverse=True)
+    return snapshots[:limit]
+
+
+# ============ API 응답 ============
+# API Gateway에 바이너리 미디어 타입이 설정된 경우에만 켤 것 (아니면 base64 문자열이 그대로 내려감)
+GZIP_RESPONSES = os.environ.get('GZIP_RESPONSES', '0') == '1'
+GZIP_MIN_BYTES = 1024
+
+
+def request_headers(event):
+    """요청 헤더 (소문자 키)"""
+    return {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+
+
+def json_response(event, payload, etag=None, status=200):
+    """JSON 응답 - ETag/If-None-Match(304), Accept-Encoding gzip 처리"""
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+    if etag:
+        headers['ETag'] = etag
+        headers['Cache-Control'] = 'no-cache'  # 매번 재검증, 바뀌지 않았으면 304
+        headers['Access-Control-Expose-Headers'] = 'ETag'
+        if etag in request_headers(event).get('if-none-match', ''):
+            return {'statusCode': 304, 'headers': headers, 'body': ''}
+    
+    if GZIP_RESPONSES:
+        headers['Vary'] = 'Accept-Encoding'
+    body = json.dumps(payload)
+    accepts_gzip = 'gzip' in request_headers(event).get('accept-encoding', '')
+    if GZIP_RESPONSES and accepts_gzip and len(body) >= GZIP_MIN_BYTES:
+        headers['Content-Encoding'] = 'gzip'
+        return {
+            'statusCode': status,
+            'headers': headers,
+            'body': base64.b64encode(gzip.compress(body.encode())).decode(),
+            'isBase64Encoded': True
+        }
+    return {'statusCode': status, 'headers': headers, 'body': body}
+
+
+def encode_cursor(date):
+    return base64.urlsafe_b64encode(json.dumps({'before': date}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """cursor → 이 날짜 이전(미포함)부터 조회 - 잘못된 cursor면 ValueError"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        before = json.loads(base64.urlsafe_b64decode(padded))['before']
+        datetime.strptime(before, '%Y-%m-%d')
+        return before
+    except (ValueError, TypeError, KeyError) as e:  # binascii.Error, UnicodeDecodeError, JSONDecodeError는 ValueError
+        raise ValueError(f'invalid cursor: {cursor}') from e
+
+
+def error_response(event, status, message):
+    """에러 응답 - ETag 없이 (클라이언트가 에러 결과를 캐시해서 304로 재사용하지 않도록)"""
+    return json_response(event, {'error': message}, status=status)
+
+
+def snapshots_version():
+    """가장 최근 스냅샷 sk - 새 스냅샷이 저장되기 전까지 히스토리 응답은 동일"""
+    from boto3.dynamodb.conditions import Key
+    response = snapshot_items_table().query(
+        KeyConditionExpression=Key('pk').eq('SNAPSHOT'),
+        ScanIndexForward=False,
+        Limit=1,
+        ProjectionExpression='sk'
+    )
+    items = response.get('Items', [])
+    return items[0]['sk'] if items else ''
+
+
+def snapshots_response(event):
+    """/snapshots - cursor 페이지네이션, fields 선택, ETag, gzip
+    
+    ?limit=90&from=YYYY-MM-DD&to=YYYY-MM-DD&cursor=...&fields=date,grand_total_usd
+    ?view=totals | ?view=rollup&period=day|week|month&assets=1
+    """
+    params = event.get('queryStringParameters') or {}
+    
+    # 잘못된 파라미터는 400
+    try:
+        limit = max(1, min(int(params.get('limit', 90)), 366))  # 기본 90일
+    except ValueError:
+        return error_response(event, 400, f"invalid limit: {params.get('limit')}")
+    end = params.get('to')
+    if params.get('view') != 'rollup':
+        for key in ('from', 'to'):
+            try:
+                if params.get(key):
+                    datetime.strptime(params[key], '%Y-%m-%d')
+            except ValueError:
+                return error_response(event, 400, f"invalid {key}: {params[key]} (YYYY-MM-DD)")
+        if params.get('cursor'):
+            try:
+                before = datetime.strptime(decode_cursor(params['cursor']), '%Y-%m-%d') - timedelta(days=1)
+            except ValueError as e:
+                return error_response(event, 400, str(e))
+            end = min(end, before.strftime('%Y-%m-%d')) if end else before.strftime('%Y-%m-%d')
+    
+    # 파라미터 + 최신 스냅샷으로 ETag - 변경 없으면 DynamoDB 본문 조회 없이 304
+    # 최신 스냅샷을 못 읽으면 ETag 없이 응답 (잘못된 버전으로 304가 나가지 않도록)
+    try:
+        version = json.dumps(params, sort_keys=True) + snapshots_version()
+        etag = '"%s"' % hashlib.sha1(version.encode()).hexdigest()
+    except Exception as e:
+        print(f"Snapshot version error: {e}")
+        etag = None
+    if etag and etag in request_headers(event).get('if-none-match', ''):
+        return json_response(event, None, etag)
+    
+    # 집계 조회: ?view=rollup&period=day|week|month
+    if params.get('view') == 'rollup':
+        try:
+            rollups = get_rollups(
+                period=params.get('period', 'day') if params.get('period') in ROLLUP_PERIODS else 'day',
+                start=params.get('from'),
+                end=params.get('to'),
+                with_assets=params.get('assets') == '1'
+            )
+        except Exception as e:
+            print(f"Rollup fetch error: {e}")
+            return json_response(event, {'rollups': [], 'error': 'rollup fetch failed'})
+        return json_response(event, {'rollups': rollups}, etag)
+    
+    fields = [f for f in params.get('fields', '').split(',') if f]
+    
+    try:
+        snapshots = get_snapshots(
+            limit=limit,
+            start=params.get('from'),
+            end=end,
+            # balances를 안 쓰면 복원하지 않음
+            totals_only=params.get('view') == 'totals' or bool(fields and 'balances' not in fields)
+        )
+    except Exception as e:
+        # 이전처럼 빈 목록이지만 ETag 없이 - 다음 요청에서 다시 조회
+        print(f"Snapshot fetch error: {e}")
+        return json_response(event, {'snapshots': [], 'error': 'snapshot fetch failed'})
+    next_cursor = encode_cursor(snapshots[-1]['date']) if snapshots and len(snapshots) == limit else None
+    if fields:
+        snapshots = [{k: snap[k] for k in fields if k in snap} for snap in snapshots]
+    
+    payload = {'snapshots': snapshots}
+    if next_cursor:
+        payload['next_cursor'] = next_cursor
+    return json_response(event, payload, etag)
+
+
+def lambda_handler(event, context):
+    """메인 핸들러 - 라우팅"""
+    
+    # API Gateway path 확인
+    path = event.get('path', '') or event.get('rawPath', '')
+    method = event.get('httpMethod', '') or event.get('requestContext', {}).get('http', {}).get('method', '')
+    RUNTIME['invocations'] += 1
+    metrics = start_metrics()
+    
+    # /snapshots 엔드포인트
+    if '/snapshots' in path:
+        response = snapshots_response(event)
+    else:
+        # 기본: 현재 잔고 조회
+        response = fetch_all_balances(event)
+    
+    if metrics is not None:
+        metrics.emit('/snapshots' if '/snapshots' in path else '/balances')
+    return response
+
+
+def runtime_info():
+    """cold start 여부와 초기화 시간 - 모듈 로드(init_ms)와 첫 사용 시 lazy 초기화(lazy_init_ms)"""
+    return {
+        'cold_start': RUNTIME['invocations'] <= 1,
+        'invocations': RUNTIME['invocations'],
+        'container_age': round(time.time() - RUNTIME['loaded_at'], 1),
+        'init_ms': round(INIT_SECONDS * 1000, 1),
+        'lazy_init_ms': {name: round(seconds * 1000, 1) for name, seconds in RUNTIME['lazy_init'].items()},
+    }
+
+
+# ============ METRICS ============
+# 요청 단위 계측 - 어떤 엔드포인트/서브계정/단계(서명, 네트워크, JSON 파싱, 평가, DynamoDB 기록)가 느린지 확인용
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'  # 0이면 계측 코드를 아예 건너뜀
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'CexBalanceDashboard')
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000)
+RATE_LIMIT_HEADER_RE = re.compile(r'ratelimit|rate-limit|used-weight|limit-status|bapi-limit', re.I)
+ENDPOINT_ID_RE = re.compile(r'/\d+(?=/|$)')  # 경로 안의 uid/account id는 묶어서 집계
+EMF_MAX_VALUES = 100  # CloudWatch EMF 한 줄당 값 배열 최대 길이
+METRICS = None  # 현재 요청의 Metrics (꺼져 있으면 None)
+METRIC_TAGS = threading.local()
+NO_PHASE = nullcontext()
+
+
+class Metrics:
+    """HTTP 호출별 지연/재시도/바이트/rate-limit 헤더와 단계별 시간 누적"""
+    
+    def __init__(self):
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.calls = {}  # endpoint -> {'latency': [ms], 'errors', 'retries', 'bytes_in', 'bytes_out'}
+        self.phases = {}  # name -> [count, seconds] (스레드 합산이라 wall time보다 클 수 있음)
+        self.rate_limits = {}  # host -> {header: 마지막 값}
+        self.slowest = []  # [(ms, endpoint, account, status)]
+        self.events = {}  # exchange -> {'retries', 'hedges', 'short_circuited'}
+    
+    def count(self, exchange, event):
+        with self.lock:
+            counts = self.events.setdefault(exchange, {})
+            counts[event] = counts.get(event, 0) + 1
+    
+    def record_call(self, method, url, status, elapsed, retries, sent, received, headers):
+        parsed = urllib.parse.urlsplit(url)
+        endpoint = f"{method} {parsed.netloc}{ENDPOINT_ID_RE.sub('/{id}', parsed.path)}"
+        ms = elapsed * 1000
+        limits = {k.lower(): v for k, v in headers.items() if RATE_LIMIT_HEADER_RE.search(k)} if headers else {}
+        account = getattr(METRIC_TAGS, 'account', None)
+        with self.lock:
+            call = self.calls.setdefault(endpoint, {'latency': [], 'errors': 0, 'retries': 0, 'bytes_in': 0, 'bytes_out': 0})
+            call['latency'].append(ms)
+            call['retries'] += retries
+            call['bytes_in'] += received
+            call['bytes_out'] += sent
+            if status is None or status >= 400:
+                call['errors'] += 1
+            if limits:
+                self.rate_limits.setdefault(parsed.netloc, {}).update(limits)
+            self.slowest = sorted(self.slowest + [(ms, endpoint, account, status)], key=lambda c: -c[0])[:5]
+            self._add_phase('network', elapsed)
+    
+    def _add_phase(self, name, seconds):
+        entry = self.phases.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+    
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self._add_phase(name, elapsed)
+    
+    def summary(self):
+        """응답에 붙일 요약"""
+        with self.lock:
+            calls = {endpoint: dict(call, latency=sorted(call['latency'])) for endpoint, call in self.calls.items()}
+            phases = {name: {'count': count, 'seconds': round(seconds, 4)} for name, (count, seconds) in self.phases.items()}
+            slowest = list(self.slowest)
+            rate_limits = {host: dict(values) for host, values in self.rate_limits.items()}
+            events = {exchange: dict(counts) for exchange, counts in self.events.items()}
+        
+        endpoints = {}
+        for endpoint, call in calls.items():
+            latency = call['latency']
+            histogram = {}
+            for bound in LATENCY_BUCKETS_MS:
+                histogram[f'<={bound}'] = sum(1 for ms in latency if ms <= bound)
+            histogram[f'>{LATENCY_BUCKETS_MS[-1]}'] = sum(1 for ms in latency if ms > LATENCY_BUCKETS_MS[-1])
+            endpoints[endpoint] = {
+                'count': len(latency),
+                'p50_ms': round(percentile(latency, 50), 1),
+                'p95_ms': round(percentile(latency, 95), 1),
+                'max_ms': round(latency[-1], 1),
+                'histogram_ms': histogram,  # 누적 (<=bound)
+                'errors': call['errors'],
+                'retries': call['retries'],
+                'bytes_in': call['bytes_in'],
+                'bytes_out': call['bytes_out'],
+            }
+        
+        return {
+            'elapsed': round(time.time() - self.started, 3),
+            'http': {
+                'calls': sum(e['count'] for e in endpoints.values()),
+                'errors': sum(e['errors'] for e in endpoints.values()),
+                'retries': sum(e['retries'] for e in endpoints.values()),
+                'bytes_in': sum(e['bytes_in'] for e in endpoints.values()),
+                'bytes_out': sum(e['bytes_out'] for e in endpoints.values()),
+            },
+            'endpoints': endpoints,
+            'phases': phases,
+            'rate_limits': rate_limits,
+            'resilience': events,
+            'slowest': [
+                {'endpoint': endpoint, 'account': account, 'ms': round(ms, 1), 'status': status}
+                for ms, endpoint, account, status in slowest
+            ],
+        }
+    
+    def emit(self, route):
+        """CloudWatch Embedded Metric Format 로그 라인 출력 - 로그에서 바로 지표로 집계됨"""
+        timestamp = int(time.time() * 1000)
+        with self.lock:
+            calls = {endpoint: dict(call) for endpoint, call in self.calls.items()}
+            phases = dict(self.phases)
+        
+        for endpoint, call in calls.items():
+            latency = call['latency']
+            for i in range(0, len(latency), EMF_MAX_VALUES):
+                line = {
+                    '_aws': {'Timestamp': timestamp, 'CloudWatchMetrics': [{
+                        'Namespace': METRICS_NAMESPACE,
+                        'Dimensions': [['Endpoint']],
+                        'Metrics': [{'Name': 'Latency', 'Unit': 'Milliseconds'}],
+                    }]},
+                    'Endpoint': endpoint,
+                    'Latency': [round(ms, 1) for ms in latency[i:i + EMF_MAX_VALUES]],
+                }
+                if i == 0:
+                    line['_aws']['CloudWatchMetrics'][0]['Metrics'] += [
+                        {'Name': 'Errors', 'Unit': 'Count'},
+                        {'Name': 'Retries', 'Unit': 'Count'},
+                        {'Name': 'BytesIn', 'Unit': 'Bytes'},
+                        {'Name': 'BytesOut', 'Unit': 'Bytes'},
+                    ]
+                    line.update(Errors=call['errors'], Retries=call['retries'],
+                                BytesIn=call['bytes_in'], BytesOut=call['bytes_out'])
+                print(json.dumps(line))
+        
+        line = {
+            '_aws': {'Timestamp': timestamp, 'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Route']],
+                'Metrics': [{'Name': 'Elapsed', 'Unit': 'Milliseconds'}] + [
+                    {'Name': f'Phase.{name}', 'Unit': 'Milliseconds'} for name in phases
+                ],
+            }]},
+            'Route': route,
+            'Elapsed': round((time.time() - self.started) * 1000, 1),
+        }
+        if RUNTIME['invocations'] <= 1:
+            # cold start 요청에만 - 모듈 로드 시간
+            line['_aws']['CloudWatchMetrics'][0]['Metrics'].append({'Name': 'InitMs', 'Unit': 'Milliseconds'})
+            line['InitMs'] = round(INIT_SECONDS * 1000, 1)
+        for name, (_, seconds) in phases.items():
+            line[f'Phase.{name}'] = round(seconds * 1000, 1)
+        print(json.dumps(line))
+
+
+def percentile(values, q):
+    """정렬된 리스트의 nearest-rank 백분위"""
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, -(-len(values) * q // 100) - 1))]
+
+
+def start_metrics():
+    """요청 시작 시 새 Metrics - 꺼져 있으면 None (이후 계측 지점은 None 체크만 함)"""
+    global METRICS
+    METRICS = Metrics() if METRICS_ENABLED else None
+    return METRICS
+
+
+def phase(name):
+    """단계 시간 측정 컨텍스트 - with phase('valuation'): ..."""
+    metrics = METRICS
+    return metrics.phase(name) if metrics is not None else NO_PHASE
+
+
+@contextmanager
+def _tagged(account):
+    previous = getattr(METRIC_TAGS, 'account', None)
+    METRIC_TAGS.account = account
+    try:
+        yield
+    finally:
+        METRIC_TAGS.account = previous
+
+
+def metric_account(account):
+    """이 스레드에서 나가는 HTTP 호출에 서브계정 표시 (slowest 목록용)"""
+    return _tagged(account) if METRICS is not None else NO_PHASE
+
+
+# ============ HTTP ============
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '16'))  # 호스트별 유지할 idle 연결 수
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', '10'))  # 시도 1회 타임아웃 - 재시도는 resilient_call
+
+
+class HTTPPool:
+    """호스트별 keep-alive 연결 풀 - 모듈 전역이라 warm 컨테이너에서 재사용됨"""
+    
+    def __init__(self, max_idle=HTTP_POOL_SIZE):
+        self.max_idle = max_idle
+        self.idle = {}  # (scheme, host) -> [connection]
+        self.lock = threading.Lock()
+    
+    def _checkout(self, scheme, host, timeout):
+        with self.lock:
+            conns = self.idle.get((scheme, host))
+            if conns:
+                conn = conns.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        conn_cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return conn_cls(host, timeout=timeout), False
+    
+    def _checkin(self, scheme, host, conn):
+        with self.lock:
+            conns = self.idle.setdefault((scheme, host), [])
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                return
+        conn.close()
+    
+    def request(self, method, url, headers, body=None, timeout=30):
+        """(status, reason, headers, body bytes) 반환 - gzip 응답은 풀어서 돌려줌"""
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        headers = dict(headers)
+        headers.setdefault('Accept-Encoding', 'gzip')
+        metrics = METRICS
+        started = time.perf_counter() if metrics is not None else 0
+        sent = len(body) if body else 0
+        
+        for attempt in range(2):
+            conn, reused = self._checkout(parsed.scheme, parsed.netloc, timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # 재사용한 연결이 서버 쪽에서 끊긴 경우 한 번만 새 연결로 재시도
+                if reused and attempt == 0:
+                    continue
+                if metrics is not None:
+                    metrics.record_call(method, url, None, time.perf_counter() - started, attempt, sent, 0, None)
+                raise
+            except Exception:
+                conn.close()
+                if metrics is not None:
+                    metrics.record_call(method, url, None, time.perf_counter() - started, attempt, sent, 0, None)
+                raise
+            
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(parsed.scheme, parsed.netloc, conn)
+            
+            if metrics is not None:
+                metrics.record_call(method, url, resp.status, time.perf_counter() - started,
+                                    attempt, sent, len(data), resp.headers)
+            if resp.headers.get('Content-Encoding', '').lower() == 'gzip':
+                with phase('decompress'):
+                    data = gzip.decompress(data)
+            return resp.status, resp.reason, resp.headers, data
+    
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for conn in conns:
+                    conn.close()
+            self.idle = {}
+
+
+HTTP_POOL = HTTPPool()
+
+
+def http_request(url, headers=None, method='GET', body=None, resp_headers=None, timeout=HTTP_TIMEOUT, parse=None):
+    """HTTP 요청 유틸리티 (resp_headers dict를 주면 응답 헤더를 채워줌, parse로 json.loads 대신 쓸 파서 지정)"""
+    headers = headers or {}
+    headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    if body:
+        body = body.encode() if isinstance(body, str) else body
+    status, reason, hdrs, data = HTTP_POOL.request(method, url, headers, body, timeout)
+    if resp_headers is not None:
+        resp_headers.update((k.lower(), v) for k, v in hdrs.items())
+    if status >= 400:
+        raise urllib.error.HTTPError(url, status, reason, hdrs, io.BytesIO(data))
+    with phase('json'):
+        return (parse or json.loads)(data)
+
+
+# ============ RESILIENCE ============
+# 일시적 5xx/타임아웃은 재시도, 느린 호출은 헤지, 장애 중인 거래소는 차단기로 즉시 실패
+RETRY_ATTEMPTS = int(os.environ.get('RETRY_ATTEMPTS', '3'))  # 첫 시도 포함
+RETRY_BASE = 0.25  # 백오프 시작 (초) - full jitter
+RETRY_CAP = 4.0
+RETRY_BUDGET = float(os.environ.get('RETRY_BUDGET', '15'))  # 호출 1건이 재시도에 쓸 수 있는 최대 시간 (EXCHANGE_DEADLINE 안쪽)
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# 헤지: 응답이 최근 p95보다 늦으면 같은 요청을 새로 서명해서 하나 더 보내고 먼저 온 응답 사용
+# (Binance는 weight 두 배, Kraken은 nonce 순서 문제로 제외)
+HEDGE_EXCHANGES = set(filter(None, os.environ.get('HEDGE_EXCHANGES', 'bybit,okx,kucoin,htx').split(',')))
+HEDGE_MIN = 0.5  # 헤지 대기 최소 (초)
+HEDGE_SAMPLES = 50  # p95 계산에 쓰는 최근 지연 수
+BREAKER_THRESHOLD = int(os.environ.get('BREAKER_THRESHOLD', '5'))  # 연속 실패 수
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', '60'))
+HEDGE_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+LATENCIES = {}  # exchange -> deque (성공한 시도의 지연)
+LATENCY_LOCK = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """거래소별 차단기 - 연속 실패가 임계치를 넘으면 cooldown 동안 즉시 실패, 이후 시험 호출 1건으로 복구 확인"""
+    
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+    
+    def before(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.time() - self.opened_at < self.cooldown:
+                raise CircuitOpenError(f'{self.name} circuit open ({self.failures} consecutive failures)')
+            if self.trial:
+                raise CircuitOpenError(f'{self.name} circuit half-open (trial call in flight)')
+            self.trial = True
+    
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+    
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"{self.name} circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.time()
+                self.trial = False
+    
+    def state(self):
+        with self.lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'open' if time.time() - self.opened_at < self.cooldown else 'half_open'
+
+
+BREAKERS = {key: CircuitBreaker(label) for key, label, _, _ in EXCHANGES}
+
+
+def retryable(e):
+    """재시도해도 되는 에러 - 5xx/429/408, 타임아웃, 연결 끊김"""
+    if isinstance(e, urllib.error.HTTPError):
+        return e.code in RETRYABLE_STATUS
+    return isinstance(e, (OSError, http.client.HTTPException))
+
+
+def retry_delay(e, attempt):
+    """Retry-After가 있으면 그 값, 없으면 full jitter 지수 백오프"""
+    if isinstance(e, urllib.error.HTTPError) and e.headers:
+        retry_after = e.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return random.uniform(0, min(RETRY_CAP, RETRY_BASE * 2 ** attempt))
+
+
+def _attempt(exchange, attempt):
+    started = time.perf_counter()
+    result = attempt()
+    with LATENCY_LOCK:
+        LATENCIES.setdefault(exchange, deque(maxlen=HEDGE_SAMPLES)).append(time.perf_counter() - started)
+    return result
+
+
+def hedge_delay(exchange):
+    """최근 지연 p95 - 표본이 부족하면 None (헤지 안 함)"""
+    with LATENCY_LOCK:
+        samples = sorted(LATENCIES.get(exchange, ()))
+    if len(samples) < 10:
+        return None
+    return max(HEDGE_MIN, percentile(samples, 95))
+
+
+def _hedged(exchange, attempt):
+    delay = hedge_delay(exchange)
+    if delay is None:
+        return _attempt(exchange, attempt)
+    first = HEDGE_POOL.submit(_attempt, exchange, attempt)
+    try:
+        return first.result(timeout=delay)
+    except FutureTimeout:
+        pass
     
-    # Binance
-    if os.environ.get('BINANCE_API_KEY'):
+    if METRICS is not None:
+        METRICS.count(exchange, 'hedges')
+    pending = {first, HEDGE_POOL.submit(_attempt, exchange, attempt)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+def mark_failed(result, name):
+    """조회 실패한 계정/섹션 기록 - 응답에서 partial로 표시, 서브계정은 이전 값으로 대체"""
+    result.setdefault('failed', []).append(name)
+
+
+def resilient_call(exchange, attempt, hedge=False):
+    """attempt()를 차단기/재시도/헤지로 감싸 호출 - attempt는 시도마다 새로 서명해서 요청해야 함"""
+    breaker = BREAKERS.get(exchange)
+    if breaker:
         try:
-            results['binance'] = fetch_binance()
-            print(f"✓ Binance: {len(results['binance'].get('total', {}))} assets")
-        except Exception as e:
-            errors['binance'] = str(e)
-            print(f"✗ Binance: {e}")
+            breaker.before()
+        except CircuitOpenError:
+            if METRICS is not None:
+                METRICS.count(exchange, 'short_circuited')
+            raise
     
-    # Bybit
-    if os.environ.get('BYBIT_API_KEY'):
+    started = time.time()
+    for n in range(RETRY_ATTEMPTS):
         try:
-            results['bybit'] = fetch_bybit()
-            print(f"✓ Bybit: {len(results['bybit'].get('total', {}))} assets")
+            if hedge and exchange in HEDGE_EXCHANGES:
+                result = _hedged(exchange, attempt)
+            else:
+                result = _attempt(exchange, attempt)
         except Exception as e:
-            errors['bybit'] = str(e)
-            print(f"✗ Bybit: {e}")
+            if not retryable(e):
+                # 4xx 등 요청 자체 문제 - 거래소는 응답하고 있으므로 차단기에는 성공으로
+                if breaker:
+                    breaker.success()
+                raise
+            delay = retry_delay(e, n)
+            if n == RETRY_ATTEMPTS - 1 or time.time() - started + delay > RETRY_BUDGET:
+                if breaker:
+                    breaker.failure()
+                raise
+            if METRICS is not None:
+                METRICS.count(exchange, 'retries')
+            print(f"{exchange} retry {n + 1}/{RETRY_ATTEMPTS - 1} in {delay:.2f}s: {e}")
+            time.sleep(delay)
+        else:
+            if breaker:
+                breaker.success()
+            return result
+
+
+class TokenBucket:
+    """capacity개를 per초마다 채우는 토큰 버킷 - 엔드포인트별 요청 한도 (예: OKX 2초당 6회)"""
     
-    # OKX
-    if os.environ.get('OKX_API_KEY'):
-        try:
-            results['okx'] = fetch_okx()
-            print(f"✓ OKX: {len(results['okx'].get('total', {}))} assets")
-        except Exception as e:
-            errors['okx'] = str(e)
-            print(f"✗ OKX: {e}")
+    def __init__(self, capacity, per):
+        self.capacity = capacity
+        self.rate = capacity / per  # 초당 토큰
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
     
-    # KuCoin
-    if os.environ.get('KUCOIN_API_KEY'):
-        try:
-            results['kucoin'] = fetch_kucoin()
-            print(f"✓ KuCoin: {len(results['kucoin'].get('total', {}))} assets")
-        except Exception as e:
-            errors['kucoin'] = str(e)
-            print(f"✗ KuCoin: {e}")
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
     
-    # Kraken
-    if os.environ.get('KRAKEN_API_KEY'):
-        try:
-            results['kraken'] = fetch_kraken()
-            print(f"✓ Kraken: {len(results['kraken'].get('total', {}))} assets")
-        except Exception as e:
-            errors['kraken'] = str(e)
-            print(f"✗ Kraken: {e}")
+    def acquire(self):
+        """토큰 1개 - 없으면 채워질 때까지 대기"""
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_s = (1 - self.tokens) / self.rate
+            time.sleep(wait_s)
+    
+    def capacity_within(self, seconds):
+        """seconds 안에 보낼 수 있는 요청 수 (현재 남은 토큰 + 채워지는 양)"""
+        with self.lock:
+            self._refill(time.monotonic())
+            return int(self.tokens + seconds * self.rate)
+
+
+# ============ SUBACCOUNT REGISTRY ============
+# 서브계정 목록과 마지막으로 잔고가 있던 시각을 live cache 백엔드(DynamoDB 또는 파일)에 저장
+# - 목록 API는 REGISTRY_REVALIDATE마다만 호출 (재검증 조회에서는 휴면 계정까지 전부 조회)
+# - DORMANT_AFTER 동안 계속 비어 있던 서브계정은 DORMANT_INTERVAL마다만 조회
+SUBACCOUNT_REGISTRY = os.environ.get('SUBACCOUNT_REGISTRY', '1') == '1'
+REGISTRY_REVALIDATE = int(os.environ.get('REGISTRY_REVALIDATE', '21600'))
+DORMANT_AFTER = int(os.environ.get('DORMANT_AFTER', str(7 * 86400)))
+DORMANT_INTERVAL = int(os.environ.get('DORMANT_INTERVAL', '21600'))
+REGISTRY_RESOLUTION = 3600  # 활성 계정의 시각은 이 단위로만 갱신 - 매 조회마다 저장하지 않도록
+REGISTRIES = {}  # exchange -> SubaccountRegistry (warm 컨테이너 재사용)
+REGISTRIES_LOCK = threading.Lock()
+
+
+class SubaccountRegistry:
+    """거래소 하나의 서브계정 - {name: {'meta', 'last_active', 'checked_at'}}, meta는 uid 등 조회에 필요한 값"""
     
-    # Zoomex
-    if os.environ.get('ZOOMEX_API_KEY'):
+    def __init__(self, exchange):
+        self.scope = f'registry#{exchange}'
+        self.exchange = exchange
+        self.accounts = {}
+        self.listed_at = 0
+        self.sweep = True  # 이번 조회가 재검증이면 휴면 계정도 조회
+        self.dirty = False
+        self.lock = threading.Lock()
+        if not SUBACCOUNT_REGISTRY:
+            return
         try:
-            results['zoomex'] = fetch_zoomex()
-            print(f"✓ Zoomex: {len(results['zoomex'].get('total', {}))} assets")
+            cached = LIVE_CACHE.get(self.scope)
         except Exception as e:
-            errors['zoomex'] = str(e)
-            print(f"✗ Zoomex: {e}")
+            print(f"Registry load error ({exchange}): {e}")
+            cached = None
+        if cached:
+            self.accounts = cached[0].get('accounts', {})
+            self.listed_at = cached[0].get('listed_at', 0)
+    
+    def listing(self):
+        return [(name, info.get('meta')) for name, info in self.accounts.items()]
+    
+    def relist(self, listed):
+        """새로 조회한 목록 [(name, meta)]로 교체 - 없어진 계정은 삭제, 새 계정은 활성으로 시작
+        
+        계정 구성이 같고 재검증 주기 전이면 아무것도 안 함 (매 조회마다 저장하지 않도록)
+        """
+        now = time.time()
+        with self.lock:
+            current = {name: info.get('meta') for name, info in self.accounts.items()}
+            if dict(listed) == current and now - self.listed_at < REGISTRY_REVALIDATE:
+                return
+            self.accounts = {
+                name: {**self.accounts.get(name, {'last_active': now, 'checked_at': 0}), 'meta': meta}
+                for name, meta in listed
+            }
+            self.listed_at = now
+            self.sweep = True
+            self.dirty = True
     
-    # HTX
-    if os.environ.get('HTX_API_KEY'):
+    def discover(self, list_accounts):
+        """서브계정 [(name, meta)] - 재검증 주기가 지났으면 list_accounts()로 새로 조회
+        
+        목록 조회가 실패해도 저장된 목록이 있으면 그대로 사용 (없으면 예외 그대로)
+        """
+        if SUBACCOUNT_REGISTRY and time.time() - self.listed_at < REGISTRY_REVALIDATE:
+            self.sweep = False
+            return self.listing()
         try:
-            results['htx'] = fetch_htx()
-            print(f"✓ HTX: {len(results['htx'].get('total', {}))} assets")
+            listed = list_accounts()
         except Exception as e:
-            errors['htx'] = str(e)
-            print(f"✗ HTX: {e}")
-    
-    # USD 가치 계산
-    calculate_usd_values(results)
+            if not (SUBACCOUNT_REGISTRY and self.listed_at):
+                raise
+            print(f"{self.exchange} subaccount list error, using registry ({len(self.accounts)}): {e}")
+            self.sweep = False
+            return self.listing()
+        self.relist(listed)
+        return listed
     
-    # 전체 총합
-    grand_total_usd = sum(data.get('exchange_total_usd', 0) for data in results.values())
+    def due(self, name):
+        """이번에 조회할 계정인지 - 최근 잔고가 있었거나 휴면 조회 주기가 됐으면"""
+        info = self.accounts.get(name)
+        if not SUBACCOUNT_REGISTRY or self.sweep or not info:
+            return True
+        now = time.time()
+        return now - info['last_active'] < DORMANT_AFTER or now - info['checked_at'] >= DORMANT_INTERVAL
     
-    response = {
-        'timestamp': datetime.now(timezone.utc).isoformat(),
-        'grand_total_usd': round(grand_total_usd, 2),
-        'balances': results,
-        'errors': errors if errors else None
-    }
+    def split(self, names):
+        """(이번에 조회할 이름, 건너뛸 휴면 계정 이름)"""
+        due = [name for name in names if self.due(name)]
+        return due, [name for name in names if not self.due(name)]
     
-    # 스케줄 트리거 (EventBridge)면 스냅샷 저장
-    if event.get('source') == 'aws.events' or event.get('save_snapshot'):
-        save_snapshot(response)
+    def record(self, name, balances):
+        """조회에 성공한 서브계정 - 잔고가 있으면 활성 시각 갱신"""
+        now = time.time()
+        with self.lock:
+            info = self.accounts.setdefault(name, {'meta': None, 'last_active': now, 'checked_at': 0})
+            if balances and now - info['last_active'] >= REGISTRY_RESOLUTION:
+                info['last_active'] = now
+                self.dirty = True
+            # 휴면 계정도 같은 단위로 충분 (REGISTRY_RESOLUTION < DORMANT_INTERVAL)
+            if now - info['checked_at'] >= REGISTRY_RESOLUTION:
+                info['checked_at'] = now
+                self.dirty = True
     
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps(response)
-    }
+    def save(self):
+        if not (SUBACCOUNT_REGISTRY and self.dirty):
+            return
+        try:
+            with self.lock:
+                data = {'accounts': dict(self.accounts), 'listed_at': self.listed_at}
+                self.dirty = False
+            LIVE_CACHE.put(self.scope, data, versioned=False)
+        except Exception as e:
+            print(f"Registry save error ({self.exchange}): {e}")
 
 
-def save_snapshot(data):
-    """DynamoDB에 스냅샷 저장"""
-    try:
-        # 싱가폴 시간 (UTC+8)
-        sgt = timezone(timedelta(hours=8))
-        now_sgt = datetime.now(sgt)
-        date_str = now_sgt.strftime('%Y-%m-%d')
-        
-        item = {
-            'date': date_str,
-            'timestamp': data['timestamp'],
-            'grand_total_usd': str(data['grand_total_usd']),
-            'balances': json.dumps(data['balances'])
-        }
-        
-        snapshots_table.put_item(Item=item)
-        print(f"Snapshot saved: {date_str}")
-    except Exception as e:
-        print(f"Snapshot save error: {e}")
+def registry(exchange):
+    """거래소별 서브계정 registry (컨테이너당 한 번 로드)"""
+    with REGISTRIES_LOCK:
+        if exchange not in REGISTRIES:
+            REGISTRIES[exchange] = SubaccountRegistry(exchange)
+        return REGISTRIES[exchange]
 
 
-def get_snapshots(limit=30):
-    """최근 스냅샷 조회"""
-    try:
-        response = snapshots_table.scan(
-            Limit=limit
-        )
-        items = response.get('Items', [])
-        
-        # 날짜 역순 정렬
-        items.sort(key=lambda x: x['date'], reverse=True)
-        
-        return [{
-            'date': item['date'],
-            'timestamp': item['timestamp'],
-            'grand_total_usd': float(item['grand_total_usd']),
-            'balances': json.loads(item['balances'])
-        } for item in items]
-    except Exception as e:
-        print(f"Snapshot fetch error: {e}")
-        return []
+def mark_dormant(result, names):
+    """휴면이라 이번에 건너뛴 서브계정 기록 (마지막 조회에서 잔고 없음)"""
+    if names:
+        result['dormant'] = names
+        print(f"Skipping {len(names)} dormant subaccounts")
 
 
-def lambda_handler(event, context):
-    """메인 핸들러 - 라우팅"""
+# ============ BINANCE ============
+BINANCE_SUB_WORKERS = int(os.environ.get('BINANCE_SUB_WORKERS', '8'))
+# 요약(summary) 엔드포인트로 빈 카테고리는 per-email 호출 생략
+BINANCE_BULK = os.environ.get('BINANCE_BULK', '1') == '1'
+
+
+class WeightBudget:
+    """분 단위 request weight 예산 - 응답 헤더의 사용량 기준으로 한도 근접 시 대기"""
     
-    # API Gateway path 확인
-    path = event.get('path', '') or event.get('rawPath', '')
-    method = event.get('httpMethod', '') or event.get('requestContext', {}).get('http', {}).get('method', '')
+    def __init__(self, header, limit, threshold=0.8):
+        self.header = header
+        self.limit = limit
+        self.threshold = threshold
+        self.used = 0
+        self.window = int(time.time() // 60)
+        self.blocked_until = 0
+        self.lock = threading.Lock()
     
-    # /snapshots 엔드포인트
-    if '/snapshots' in path:
-        snapshots = get_snapshots(limit=90)  # 최대 90일
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'snapshots': snapshots})
-        }
+    def _roll(self, now):
+        window = int(now // 60)
+        if window != self.window:
+            self.window = window
+            self.used = 0
+    
+    def acquire(self, cost=1):
+        """cost만큼 예약 - 예산 초과 시 다음 분(또는 Retry-After)까지 대기"""
+        while True:
+            with self.lock:
+                now = time.time()
+                self._roll(now)
+                if now >= self.blocked_until and self.used + cost <= self.limit * self.threshold:
+                    self.used += cost
+                    return
+                wait_s = max(self.blocked_until - now, (self.window + 1) * 60 - now, 0.05)
+            print(f"Binance {self.header} {self.used}/{self.limit} - throttling {wait_s:.1f}s")
+            time.sleep(wait_s)
     
-    # 기본: 현재 잔고 조회
-    return fetch_all_balances(event)
+    def update(self, headers):
+        """응답 헤더의 실제 사용량 반영"""
+        used = headers.get(self.header)
+        if used is None:
+            return
+        with self.lock:
+            self._roll(time.time())
+            self.used = max(self.used, int(used))
+    
+    def block(self, seconds):
+        """429/418 수신 시 Retry-After 동안 전체 요청 중지"""
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.time() + seconds)
 
 
-def http_request(url, headers=None, method='GET', body=None):
-    """HTTP 요청 유틸리티"""
-    headers = headers or {}
-    headers['User-Agent'] = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-    req = urllib.request.Request(url, headers=headers, method=method)
-    if body:
-        req.data = body.encode() if isinstance(body, str) else body
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read().decode())
+# 호스트/엔드포인트 그룹별 예산 (warm 컨테이너에서 재사용)
+BINANCE_BUDGETS = {
+    'api': WeightBudget('x-mbx-used-weight-1m', 6000),
+    'sapi_ip': WeightBudget('x-sapi-used-ip-weight-1m', 12000),
+    'sapi_uid': WeightBudget('x-sapi-used-uid-weight-1m', 180000),
+    'fapi': WeightBudget('x-mbx-used-weight-1m', 2400),
+}
+
+
+def binance_budgets(base, endpoint):
+    """요청이 차감되는 예산 목록"""
+    if 'fapi' in base:
+        return [BINANCE_BUDGETS['fapi']]
+    if endpoint.startswith('/sapi/'):
+        return [BINANCE_BUDGETS['sapi_ip'], BINANCE_BUDGETS['sapi_uid']]
+    return [BINANCE_BUDGETS['api']]
 
 
-# ============ BINANCE ============
 def fetch_binance():
     api_key = os.environ['BINANCE_API_KEY']
     api_secret = os.environ['BINANCE_API_SECRET']
     
     result = {'master': {}, 'subaccounts': {}, 'total': {}}
     
-    def binance_req(endpoint, params=None, base='https://api.binance.com'):
-        params = params or {}
-        params['timestamp'] = int(time.time() * 1000)
-        query = urllib.parse.urlencode(params)
-        signature = hmac.new(api_secret.encode(), query.encode(), hashlib.sha256).hexdigest()
-        url = f'{base}{endpoint}?{query}&signature={signature}'
-        return http_request(url, {'X-MBX-APIKEY': api_key})
+    def binance_req(endpoint, params=None, base='https://api.binance.com', weight=10):
+        budgets = binance_budgets(base, endpoint)
+        
+        def attempt():
+            # 재시도마다 weight 예약 + timestamp 새로 서명
+            for budget in budgets:
+                budget.acquire(weight)
+            
+            signed = {**(params or {}), 'timestamp': int(time.time() * 1000)}
+            with phase('sign'):
+                query = urllib.parse.urlencode(signed)
+                signature = hmac.new(api_secret.encode(), query.encode(), hashlib.sha256).hexdigest()
+            url = f'{base}{endpoint}?{query}&signature={signature}'
+            resp_headers = {}
+            try:
+                return http_request(url, {'X-MBX-APIKEY': api_key}, resp_headers=resp_headers)
+            except urllib.error.HTTPError as e:
+                # 429: 한도 초과, 418: IP 밴 - Retry-After 동안 모든 요청 중지
+                if e.code in (429, 418):
+                    retry_after = int(resp_headers.get('retry-after', 60))
+                    for budget in budgets:
+                        budget.block(retry_after)
+                raise
+            finally:
+                for budget in budgets:
+                    budget.update(resp_headers)
+        
+        return resilient_call('binance', attempt)
     
     # Master Spot account
     data = binance_req('/api/v3/account')
@@ -330,6 +2237,7 @@ def fetch_binance():
                 print(f"Binance Earn Flexible {asset}: {amt}")
     except Exception as e:
         print(f"Binance earn flexible error: {e}")
+        mark_failed(result, 'master:earn_flexible')
     
     # Simple Earn - Locked
     try:
@@ -344,6 +2252,7 @@ def fetch_binance():
                 print(f"Binance Earn Locked {asset}: {amt}")
     except Exception as e:
         print(f"Binance earn locked error: {e}")
+        mark_failed(result, 'master:earn_locked')
     
     # Master Futures (USDT-M) - wallet과 uPnL 분리 저장
     try:
@@ -364,27 +2273,80 @@ def fetch_binance():
                     print(f"Binance Master {ccy}_FUTURES: wallet={wallet}, uPnL={upnl}, margin={margin}")
     except Exception as e:
         print(f"Binance master futures error: {e}")
+        mark_failed(result, 'master:futures')
     
-    # Subaccounts
-    try:
-        subs = binance_req('/sapi/v1/sub-account/list')
-        print(f"Binance subaccounts found: {len(subs.get('subAccounts', []))}")
+    def paged(endpoint, extract, size_param, params=None, page_size=20):
+        """page 파라미터로 끝까지 조회 (page_size 미만이면 마지막 페이지)"""
+        rows = []
+        page = 1
+        while True:
+            data = binance_req(endpoint, {**(params or {}), 'page': page, size_param: page_size})
+            batch = extract(data) or []
+            rows.extend(batch)
+            if len(batch) < page_size:
+                return rows
+            page += 1
+    
+    def active_subs():
+        """요약 엔드포인트로 카테고리별 잔고가 있는 email 집합 - 실패한 카테고리는 None (전부 조회)"""
+        summaries = {
+            'spot': lambda: {
+                r['email'] for r in paged('/sapi/v1/sub-account/spotSummary',
+                                          lambda d: d.get('spotSubUserAssetBtcVoList'), 'size')
+                if float(r.get('totalAsset', 0)) != 0
+            },
+            'futures': lambda: {
+                r['email'] for r in paged('/sapi/v2/sub-account/futures/accountSummary',
+                                          lambda d: d.get('futureAccountSummaryResp', {}).get('subAccountList'),
+                                          'limit', {'futuresType': 1})
+                if float(r.get('totalMarginBalance', 0)) != 0
+            },
+            'coin_futures': lambda: {
+                r['email'] for r in paged('/sapi/v2/sub-account/futures/accountSummary',
+                                          lambda d: d.get('deliveryAccountSummaryResp', {}).get('subAccountList'),
+                                          'limit', {'futuresType': 2})
+                if float(r.get('totalMarginBalanceOfBTC', 0)) != 0
+            },
+            # 마진 요약은 페이지 없이 마진 활성화된 서브계정 전체 반환
+            'margin': lambda: {
+                r['email'] for r in binance_req('/sapi/v1/sub-account/margin/accountSummary').get('subAccountList', [])
+                if float(r.get('totalAssetOfBtc', 0)) != 0 or float(r.get('totalLiabilityOfBtc', 0)) != 0
+            },
+        }
+        active = {}
+        for category, load in summaries.items():
+            try:
+                active[category] = load()
+                print(f"Binance {category} summary: {len(active[category])} active subaccounts")
+            except Exception as e:
+                print(f"Binance {category} summary error: {e}")
+                active[category] = None
+        return active
+    
+    def fetch_sub(email, active=None):
+        """서브계정 1개의 spot/선물/마진 잔고 - (sub_bal, sub_upnl, 실패한 카테고리) 반환"""
+        sub_bal = {}
+        sub_upnl = {}
+        failed = []
+        active = active or {}
         
-        for sub in subs.get('subAccounts', []):
-            email = sub['email']
-            sub_bal = {}
-            
-            # Spot balance
+        def wanted(category):
+            return active.get(category) is None or email in active[category]
+        
+        # Spot balance
+        if wanted('spot'):
             try:
-                assets = binance_req('/sapi/v4/sub-account/assets', {'email': email})
+                assets = binance_req('/sapi/v4/sub-account/assets', {'email': email}, weight=60)
                 for a in assets.get('balances', []):
                     total = float(a.get('free', 0)) + float(a.get('locked', 0))
                     if total > 0:
                         sub_bal[a['asset']] = total
             except Exception as e:
                 print(f"  {email} spot error: {e}")
-            
-            # Futures USDT-M balance - wallet과 uPnL 분리
+                failed.append('spot')
+        
+        # Futures USDT-M balance - wallet과 uPnL 분리
+        if wanted('futures'):
             try:
                 fut = binance_req('/sapi/v2/sub-account/futures/account', {'email': email, 'futuresType': 1})
                 fut_resp = fut.get('futureAccountResp', {})
@@ -400,12 +2362,14 @@ def fetch_binance():
                         sub_bal[key] = sub_bal.get(key, 0) + margin
                         # uPnL 분리 저장
                         if upnl != 0:
-                            result['upnl'][key] = result['upnl'].get(key, 0) + upnl
+                            sub_upnl[key] = sub_upnl.get(key, 0) + upnl
                         print(f"  {email} {ccy}_FUTURES: wallet={wallet}, uPnL={upnl}")
             except Exception as e:
                 print(f"  {email} futures error: {e}")
-            
-            # Futures COIN-M balance - marginBalance 사용
+                failed.append('futures')
+        
+        # Futures COIN-M balance - marginBalance 사용
+        if wanted('coin_futures'):
             try:
                 fut_coin = binance_req('/sapi/v2/sub-account/futures/account', {'email': email, 'futuresType': 2})
                 fut_resp = fut_coin.get('deliveryAccountResp', {})
@@ -419,8 +2383,10 @@ def fetch_binance():
                         print(f"  {email} {ccy}_COIN_FUTURES: {margin} (margin)")
             except Exception as e:
                 print(f"  {email} coin futures error: {e}")
-            
-            # Cross Margin balance
+                failed.append('coin_futures')
+        
+        # Cross Margin balance
+        if wanted('margin'):
             try:
                 margin_data = binance_req('/sapi/v1/sub-account/margin/account', {'email': email})
                 for asset in margin_data.get('marginUserAssetVoList', []):
@@ -432,15 +2398,59 @@ def fetch_binance():
                         print(f"  {email} {ccy}_MARGIN: {net}")
             except Exception as e:
                 print(f"  {email} margin error: {e}")
+                failed.append('margin')
+        
+        return sub_bal, sub_upnl, failed
+    
+    # Subaccounts - 서브계정별 조회를 병렬로 (weight 예산 내에서)
+    reg = registry('binance')
+    try:
+        listed = reg.discover(lambda: [
+            (sub['email'], None) for sub in binance_req('/sapi/v1/sub-account/list').get('subAccounts', [])
+        ])
+        emails = [email for email, _ in listed]
+        print(f"Binance subaccounts found: {len(emails)}")
+        
+        # bulk 모드: 요약에서 잔고가 하나도 없는 서브계정은 건너뜀
+        active = active_subs() if BINANCE_BULK and emails else {}
+        if active and all(v is not None for v in active.values()):
+            with_balances = [e for e in emails if any(e in v for v in active.values())]
+            for email in set(emails) - set(with_balances):
+                reg.record(email, {})
+            emails = with_balances
+            print(f"Binance subaccounts with balances: {len(emails)}")
+        else:
+            # 요약이 없으면 registry로 휴면 계정 건너뜀
+            emails, dormant = reg.split(emails)
+            mark_dormant(result, dormant)
+        
+        def fetch_sub_tagged(email):
+            with metric_account(email):
+                return fetch_sub(email, active)
+        
+        if emails:
+            with ThreadPoolExecutor(max_workers=min(BINANCE_SUB_WORKERS, len(emails))) as executor:
+                sub_results = list(executor.map(fetch_sub_tagged, emails))
             
-            # Add to results
-            if sub_bal:
-                result['subaccounts'][email] = sub_bal
-                for ccy, amt in sub_bal.items():
-                    result['total'][ccy] = result['total'].get(ccy, 0) + amt
+            # 병합은 메인 스레드에서 순서대로
+            for email, (sub_bal, sub_upnl, sub_failed) in zip(emails, sub_results):
+                if sub_failed:
+                    mark_failed(result, email)
+                else:
+                    reg.record(email, sub_bal)
+                if sub_upnl:
+                    result.setdefault('upnl', {})
+                    for key, upnl in sub_upnl.items():
+                        result['upnl'][key] = result['upnl'].get(key, 0) + upnl
+                if sub_bal:
+                    result['subaccounts'][email] = sub_bal
+                    for ccy, amt in sub_bal.items():
+                        result['total'][ccy] = result['total'].get(ccy, 0) + amt
                     
     except Exception as e:
         print(f"Binance subaccount list error: {e}")
+        mark_failed(result, 'subaccounts')
+    reg.save()
     
     return result
 
@@ -460,103 +2470,144 @@ def fetch_bybit():
         ak = sub_api_key if use_sub_key else api_key
         sk = sub_api_secret if use_sub_key else api_secret
         
-        timestamp = str(int(time.time() * 1000))
-        recv_window = '5000'
-        query = urllib.parse.urlencode(params) if params else ''
-        sign_str = f"{timestamp}{ak}{recv_window}{query}"
-        signature = hmac.new(sk.encode(), sign_str.encode(), hashlib.sha256).hexdigest()
+        def attempt():
+            timestamp = str(int(time.time() * 1000))
+            recv_window = '5000'
+            with phase('sign'):
+                query = urllib.parse.urlencode(params) if params else ''
+                sign_str = f"{timestamp}{ak}{recv_window}{query}"
+                signature = hmac.new(sk.encode(), sign_str.encode(), hashlib.sha256).hexdigest()
+            
+            headers = {
+                'X-BAPI-API-KEY': ak,
+                'X-BAPI-TIMESTAMP': timestamp,
+                'X-BAPI-RECV-WINDOW': recv_window,
+                'X-BAPI-SIGN': signature
+            }
+            url = f'https://api.bybit.com{endpoint}'
+            if query:
+                url += f'?{query}'
+            return http_request(url, headers)
         
-        headers = {
-            'X-BAPI-API-KEY': ak,
-            'X-BAPI-TIMESTAMP': timestamp,
-            'X-BAPI-RECV-WINDOW': recv_window,
-            'X-BAPI-SIGN': signature
-        }
-        url = f'https://api.bybit.com{endpoint}'
-        if query:
-            url += f'?{query}'
-        return http_request(url, headers)
+        return resilient_call('bybit', attempt, hedge=True)
     
     # Master - Unified account (equity 사용)
     data = bybit_req('/v5/account/wallet-balance', {'accountType': 'UNIFIED'})
-    if data.get('retCode') == 0:
-        for coin in data.get('result', {}).get('list', [{}])[0].get('coin', []):
-            equity = float(coin.get('equity', 0))
-            if equity == 0:
-                equity = float(coin.get('walletBalance', 0))
-            if equity != 0:
-                result['master'][coin['coin']] = equity
-                result['total'][coin['coin']] = equity
+    if data.get('retCode') != 0:
+        raise ValueError(f"retCode {data.get('retCode')}: {data.get('retMsg')}")
+    for coin in data.get('result', {}).get('list', [{}])[0].get('coin', []):
+        equity = float(coin.get('equity', 0))
+        if equity == 0:
+            equity = float(coin.get('walletBalance', 0))
+        if equity != 0:
+            result['master'][coin['coin']] = equity
+            result['total'][coin['coin']] = equity
     
     # Master - FUND account (deposits/withdrawals wallet)
     try:
         fund_data = bybit_req('/v5/asset/transfer/query-account-coins-balance', {'accountType': 'FUND'})
-        if fund_data.get('retCode') == 0:
-            for coin in fund_data.get('result', {}).get('balance', []):
-                bal = float(coin.get('walletBalance', 0))
-                if bal > 0:
-                    key = f"{coin['coin']}_FUND"
-                    result['master'][key] = bal
-                    result['total'][key] = result['total'].get(key, 0) + bal
-                    print(f"Bybit FUND {coin['coin']}: {bal}")
+        if fund_data.get('retCode') != 0:
+            raise ValueError(f"retCode {fund_data.get('retCode')}: {fund_data.get('retMsg')}")
+        for coin in fund_data.get('result', {}).get('balance', []):
+            bal = float(coin.get('walletBalance', 0))
+            if bal > 0:
+                key = f"{coin['coin']}_FUND"
+                result['master'][key] = bal
+                result['total'][key] = result['total'].get(key, 0) + bal
+                print(f"Bybit FUND {coin['coin']}: {bal}")
     except Exception as e:
         print(f"Bybit FUND error: {e}")
+        mark_failed(result, 'master:fund')
     
     # Subaccounts - 서브계정 API 키로 equity 조회
     if sub_api_key and sub_api_secret:
         try:
             sub_data = bybit_req('/v5/account/wallet-balance', {'accountType': 'UNIFIED'}, use_sub_key=True)
-            if sub_data.get('retCode') == 0:
-                sub_bal = {}
-                result['upnl'] = result.get('upnl', {})
-                for coin in sub_data.get('result', {}).get('list', [{}])[0].get('coin', []):
-                    equity = float(coin.get('equity', 0))
-                    wallet = float(coin.get('walletBalance', 0))
-                    upl = float(coin.get('unrealisedPnl', 0))
-                    if equity != 0:
-                        sub_bal[coin['coin']] = equity
-                        # uPnL 분리 저장
-                        if upl != 0:
-                            result['upnl'][coin['coin']] = result['upnl'].get(coin['coin'], 0) + upl
-                        print(f"  Bybit Sub {coin['coin']}: wallet={wallet}, uPnL={upl}, equity={equity}")
-                
-                if sub_bal:
-                    result['subaccounts']['BybitH7JSSEtym6M'] = sub_bal
-                    for ccy, amt in sub_bal.items():
-                        result['total'][ccy] = result['total'].get(ccy, 0) + amt
-                    print(f"Bybit subaccount equity loaded")
+            if sub_data.get('retCode') != 0:
+                raise ValueError(f"retCode {sub_data.get('retCode')}: {sub_data.get('retMsg')}")
+            sub_bal = {}
+            result['upnl'] = result.get('upnl', {})
+            for coin in sub_data.get('result', {}).get('list', [{}])[0].get('coin', []):
+                equity = float(coin.get('equity', 0))
+                wallet = float(coin.get('walletBalance', 0))
+                upl = float(coin.get('unrealisedPnl', 0))
+                if equity != 0:
+                    sub_bal[coin['coin']] = equity
+                    # uPnL 분리 저장
+                    if upl != 0:
+                        result['upnl'][coin['coin']] = result['upnl'].get(coin['coin'], 0) + upl
+                    print(f"  Bybit Sub {coin['coin']}: wallet={wallet}, uPnL={upl}, equity={equity}")
+            
+            if sub_bal:
+                result['subaccounts']['BybitH7JSSEtym6M'] = sub_bal
+                for ccy, amt in sub_bal.items():
+                    result['total'][ccy] = result['total'].get(ccy, 0) + amt
+                print(f"Bybit subaccount equity loaded")
         except Exception as e:
             print(f"Bybit sub API error: {e}")
+            mark_failed(result, 'BybitH7JSSEtym6M')
     else:
         # Fallback: 마스터 API로 wallet balance만 조회
-        try:
+        reg = registry('bybit')
+        
+        def list_members():
             subs = bybit_req('/v5/user/query-sub-members', {})
-            if subs.get('retCode') == 0:
-                for sub in subs.get('result', {}).get('subMembers', []):
-                    uid = sub.get('uid')
-                    username = sub.get('username', str(uid))
-                    sub_bal = {}
-                    
-                    coins = 'BTC,ETH,USDT,USDC,USDE,XRP,SOL,DOGE,ADA,AVAX'
+            if subs.get('retCode') != 0:
+                raise ValueError(f"retCode {subs.get('retCode')}: {subs.get('retMsg')}")
+            return [
+                (sub.get('username', str(sub.get('uid'))), sub.get('uid'))
+                for sub in subs.get('result', {}).get('subMembers', [])
+            ]
+        
+        try:
+            members = dict(reg.discover(list_members))
+            due, dormant = reg.split(list(members))
+            mark_dormant(result, dormant)
+            for username in due:
+                uid = members[username]
+                sub_bal = {}
+                
+                coins = 'BTC,ETH,USDT,USDC,USDE,XRP,SOL,DOGE,ADA,AVAX'
+                try:
                     sub_wallet = bybit_req('/v5/asset/transfer/query-account-coins-balance', 
                                           {'accountType': 'UNIFIED', 'memberId': uid, 'coin': coins})
-                    if sub_wallet.get('retCode') == 0:
-                        for c in sub_wallet.get('result', {}).get('balance', []):
-                            total = float(c.get('walletBalance', 0))
-                            if total > 0:
-                                sub_bal[c['coin']] = total
-                    
-                    if sub_bal:
-                        result['subaccounts'][username] = sub_bal
-                        for ccy, amt in sub_bal.items():
-                            result['total'][ccy] = result['total'].get(ccy, 0) + amt
+                    if sub_wallet.get('retCode') != 0:
+                        raise ValueError(f"retCode {sub_wallet.get('retCode')}: {sub_wallet.get('retMsg')}")
+                except Exception as e:
+                    print(f"Bybit subaccount {username} error: {e}")
+                    mark_failed(result, username)
+                    continue
+                for c in sub_wallet.get('result', {}).get('balance', []):
+                    total = float(c.get('walletBalance', 0))
+                    if total > 0:
+                        sub_bal[c['coin']] = total
+                reg.record(username, sub_bal)
+                
+                if sub_bal:
+                    result['subaccounts'][username] = sub_bal
+                    for ccy, amt in sub_bal.items():
+                        result['total'][ccy] = result['total'].get(ccy, 0) + amt
         except Exception as e:
             print(f"Bybit subaccount error: {e}")
+            mark_failed(result, 'subaccounts')
+        reg.save()
     
     return result
 
 
 # ============ OKX ============
+OKX_SUB_WORKERS = int(os.environ.get('OKX_SUB_WORKERS', '6'))
+# 서브계정 잔고 조회에 쓸 최대 시간 - 한도상 이 안에 못 끝나는 서브계정은 이전 값을 쓰고 다음 조회에서 순서대로 갱신
+OKX_SUB_BUDGET = float(os.environ.get('OKX_SUB_BUDGET', '12'))
+OKX_PAGE_SIZE = 100
+# 문서화된 엔드포인트별 한도 (2초당 요청 수) - 모듈 전역이라 warm 컨테이너 연속 호출에도 유지
+OKX_BUCKETS = {
+    'subaccount_list': TokenBucket(2, 2),
+    'subaccount_balances': TokenBucket(6, 2),
+}
+OKX_STATE = {'offset': 0}  # 예산 초과 시 다음 조회를 시작할 서브계정 위치 (순환)
+
+
 def fetch_okx():
     api_key = os.environ['OKX_API_KEY']
     api_secret = os.environ['OKX_API_SECRET']
@@ -564,67 +2615,143 @@ def fetch_okx():
     
     result = {'master': {}, 'subaccounts': {}, 'total': {}, 'usd_values': {}}
     
-    def okx_req(endpoint):
-        timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.') + f'{datetime.utcnow().microsecond // 1000:03d}Z'
-        sign_str = timestamp + 'GET' + endpoint
-        signature = base64.b64encode(hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).digest()).decode()
+    def okx_req(endpoint, bucket=None):
+        def attempt():
+            # 한도가 있는 엔드포인트는 재시도도 토큰을 받아서
+            if bucket:
+                bucket.acquire()
+            timestamp = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.') + f'{datetime.utcnow().microsecond // 1000:03d}Z'
+            with phase('sign'):
+                sign_str = timestamp + 'GET' + endpoint
+                signature = base64.b64encode(hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).digest()).decode()
+            
+            headers = {
+                'OK-ACCESS-KEY': api_key,
+                'OK-ACCESS-SIGN': signature,
+                'OK-ACCESS-TIMESTAMP': timestamp,
+                'OK-ACCESS-PASSPHRASE': passphrase
+            }
+            return http_request(f'https://www.okx.com{endpoint}', headers)
         
-        headers = {
-            'OK-ACCESS-KEY': api_key,
-            'OK-ACCESS-SIGN': signature,
-            'OK-ACCESS-TIMESTAMP': timestamp,
-            'OK-ACCESS-PASSPHRASE': passphrase
-        }
-        return http_request(f'https://www.okx.com{endpoint}', headers)
+        # 헤지는 한도 밖에서 요청을 하나 더 보내므로 한도가 있는 엔드포인트에는 안 씀
+        return resilient_call('okx', attempt, hedge=bucket is None)
     
-    # Master
-    data = okx_req('/api/v5/account/balance')
-    if data.get('code') == '0':
-        for detail in data.get('data', [{}])[0].get('details', []):
-            total = float(detail.get('cashBal', 0))
-            eq_usd = float(detail.get('eqUsd', 0))
+    def list_subs():
+        """서브계정 이름 전체 - 생성 시각(ts) 역순 페이지를 after로 끝까지"""
+        names = []
+        after = None
+        while True:
+            endpoint = f'/api/v5/users/subaccount/list?limit={OKX_PAGE_SIZE}'
+            if after:
+                endpoint += f'&after={after}'
+            data = okx_req(endpoint, OKX_BUCKETS['subaccount_list'])
+            if data.get('code') != '0':
+                raise ValueError(f"code {data.get('code')}: {data.get('msg')}")
+            rows = data.get('data', [])
+            names.extend(row['subAcct'] for row in rows)
+            if len(rows) < OKX_PAGE_SIZE:
+                return names
+            after = rows[-1]['ts']
+    
+    def fetch_sub(sub_name):
+        """서브계정 1개 trading 잔고 - (sub_bal, sub_usd)"""
+        data = okx_req(f'/api/v5/account/subaccount/balances?subAcct={sub_name}', OKX_BUCKETS['subaccount_balances'])
+        if data.get('code') != '0':
+            raise ValueError(f"code {data.get('code')}: {data.get('msg')}")
+        sub_bal = {}
+        sub_usd = {}
+        for d in data.get('data', [{}])[0].get('details', []):
+            total = float(d.get('cashBal', 0))
+            eq_usd = float(d.get('eqUsd', 0))
             if total > 0:
-                ccy = detail['ccy']
-                result['master'][ccy] = total
-                result['total'][ccy] = total
+                ccy = d['ccy']
+                sub_bal[ccy] = total
                 if eq_usd > 0:
-                    result['usd_values'][ccy] = eq_usd
+                    sub_usd[ccy] = eq_usd
+        return sub_bal, sub_usd
+    
+    def fetch_sub_tagged(sub_name):
+        with metric_account(sub_name):
+            try:
+                return fetch_sub(sub_name), None
+            except Exception as e:
+                return None, e
+    
+    # Master
+    data = okx_req('/api/v5/account/balance')
+    if data.get('code') != '0':
+        raise ValueError(f"code {data.get('code')}: {data.get('msg')}")
+    for detail in data.get('data', [{}])[0].get('details', []):
+        total = float(detail.get('cashBal', 0))
+        eq_usd = float(detail.get('eqUsd', 0))
+        if total > 0:
+            ccy = detail['ccy']
+            result['master'][ccy] = total
+            result['total'][ccy] = total
+            if eq_usd > 0:
+                result['usd_values'][ccy] = eq_usd
     
-    # Subaccounts
+    # Subaccounts - 한도(2초당 6회) 안에서 병렬 조회
+    reg = registry('okx')
     try:
-        subs = okx_req('/api/v5/users/subaccount/list')
-        if subs.get('code') == '0':
-            for sub in subs.get('data', []):
-                sub_name = sub.get('subAcct')
-                try:
-                    sub_data = okx_req(f'/api/v5/account/subaccount/balances?subAcct={sub_name}')
-                    if sub_data.get('code') == '0':
-                        sub_bal = {}
-                        sub_usd = {}
-                        for d in sub_data.get('data', [{}])[0].get('details', []):
-                            total = float(d.get('cashBal', 0))
-                            eq_usd = float(d.get('eqUsd', 0))
-                            if total > 0:
-                                ccy = d['ccy']
-                                sub_bal[ccy] = total
-                                result['total'][ccy] = result['total'].get(ccy, 0) + total
-                                if eq_usd > 0:
-                                    sub_usd[ccy] = eq_usd
-                                    result['usd_values'][ccy] = result['usd_values'].get(ccy, 0) + eq_usd
-                                print(f"OKX {sub_name} {ccy}: {total} (${eq_usd:.2f})")
-                        # Always add subaccount even if empty
-                        result['subaccounts'][sub_name] = sub_bal if sub_bal else {}
-                        result['subaccounts_usd_direct'] = result.get('subaccounts_usd_direct', {})
-                        result['subaccounts_usd_direct'][sub_name] = sub_usd if sub_usd else {}
-                except Exception as e:
-                    print(f"OKX subaccount {sub_name} error: {e}")
+        names = [name for name, _ in reg.discover(lambda: [(name, None) for name in list_subs()])]
+        print(f"OKX subaccounts found: {len(names)}")
     except Exception as e:
         print(f"OKX subaccount list error: {e}")
+        mark_failed(result, 'subaccounts')
+        return result
+    
+    # 휴면 계정은 마지막 조회처럼 빈 잔고로
+    names, dormant = reg.split(names)
+    mark_dormant(result, dormant)
+    for sub_name in dormant:
+        result['subaccounts'][sub_name] = {}
+    
+    # 예산 안에 못 끝나는 만큼은 이번에 건너뜀 - 이전 값으로 채우고 (patch_partial) 다음 조회는 이어서
+    limit = OKX_BUCKETS['subaccount_balances'].capacity_within(OKX_SUB_BUDGET)
+    selected = names
+    if len(names) > limit:
+        offset = OKX_STATE['offset'] % len(names)
+        selected = (names[offset:] + names[:offset])[:limit]
+        OKX_STATE['offset'] = offset + limit
+        deferred = set(names) - set(selected)
+        print(f"OKX subaccounts over budget: fetching {len(selected)}, deferring {len(deferred)}")
+        for name in names:
+            if name in deferred:
+                mark_failed(result, name)
+    
+    if selected:
+        with ThreadPoolExecutor(max_workers=min(OKX_SUB_WORKERS, len(selected))) as executor:
+            sub_results = list(executor.map(fetch_sub_tagged, selected))
+        
+        # 병합은 메인 스레드에서 순서대로
+        for sub_name, (balances, error) in zip(selected, sub_results):
+            if error is not None:
+                print(f"OKX subaccount {sub_name} error: {error}")
+                mark_failed(result, sub_name)
+                continue
+            sub_bal, sub_usd = balances
+            reg.record(sub_name, sub_bal)
+            for ccy, total in sub_bal.items():
+                result['total'][ccy] = result['total'].get(ccy, 0) + total
+                eq_usd = sub_usd.get(ccy, 0)
+                if eq_usd:
+                    result['usd_values'][ccy] = result['usd_values'].get(ccy, 0) + eq_usd
+                print(f"OKX {sub_name} {ccy}: {total} (${eq_usd:.2f})")
+            # Always add subaccount even if empty
+            result['subaccounts'][sub_name] = sub_bal
+            result.setdefault('subaccounts_usd_direct', {})[sub_name] = sub_usd
+    reg.save()
     
     return result
 
 
 # ============ KUCOIN ============
+KUCOIN_SUB_WORKERS = int(os.environ.get('KUCOIN_SUB_WORKERS', '4'))  # 서브계정별 조회 fallback 동시 요청 수
+KUCOIN_PAGE_SIZE = 100
+KUCOIN_ACCOUNT_TYPES = ['mainAccounts', 'tradeAccounts', 'marginAccounts']
+
+
 def fetch_kucoin():
     api_key = os.environ['KUCOIN_API_KEY']
     api_secret = os.environ['KUCOIN_API_SECRET']
@@ -633,56 +2760,119 @@ def fetch_kucoin():
     result = {'master': {}, 'subaccounts': {}, 'total': {}}
     
     def kucoin_req(endpoint):
-        timestamp = str(int(time.time() * 1000))
-        sign_str = timestamp + 'GET' + endpoint
-        signature = base64.b64encode(hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).digest()).decode()
-        pass_hash = base64.b64encode(hmac.new(api_secret.encode(), passphrase.encode(), hashlib.sha256).digest()).decode()
+        def attempt():
+            timestamp = str(int(time.time() * 1000))
+            with phase('sign'):
+                sign_str = timestamp + 'GET' + endpoint
+                signature = base64.b64encode(hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).digest()).decode()
+                pass_hash = base64.b64encode(hmac.new(api_secret.encode(), passphrase.encode(), hashlib.sha256).digest()).decode()
+            
+            headers = {
+                'KC-API-KEY': api_key,
+                'KC-API-SIGN': signature,
+                'KC-API-TIMESTAMP': timestamp,
+                'KC-API-PASSPHRASE': pass_hash,
+                'KC-API-KEY-VERSION': '2'
+            }
+            return http_request(f'https://api.kucoin.com{endpoint}', headers)
         
-        headers = {
-            'KC-API-KEY': api_key,
-            'KC-API-SIGN': signature,
-            'KC-API-TIMESTAMP': timestamp,
-            'KC-API-PASSPHRASE': pass_hash,
-            'KC-API-KEY-VERSION': '2'
-        }
-        return http_request(f'https://api.kucoin.com{endpoint}', headers)
+        return resilient_call('kucoin', attempt, hedge=True)
+    
+    def kucoin_pages(endpoint):
+        """currentPage/pageSize 페이지 전부 - items 합쳐서 반환"""
+        items = []
+        page = 1
+        while True:
+            data = kucoin_req(f'{endpoint}?currentPage={page}&pageSize={KUCOIN_PAGE_SIZE}')
+            if data.get('code') != '200000':
+                raise ValueError(f"code {data.get('code')}: {data.get('msg')}")
+            body = data.get('data') or {}
+            items.extend(body.get('items') or [])
+            if page >= int(body.get('totalPage') or 1):
+                return items
+            page += 1
+    
+    def parse_sub(accounts):
+        sub_bal = {}
+        for acc_type in KUCOIN_ACCOUNT_TYPES:
+            for acc in accounts.get(acc_type) or []:
+                total = float(acc.get('balance', 0))
+                if total > 0:
+                    ccy = acc['currency']
+                    sub_bal[ccy] = sub_bal.get(ccy, 0) + total
+        return sub_bal
+    
+    def fetch_sub_tagged(name):
+        """fallback: 서브계정 1개 - (name, sub_bal, error)"""
+        uid = members[name]
+        with metric_account(name):
+            try:
+                sub_data = kucoin_req(f'/api/v1/sub-accounts/{uid}')
+                if sub_data.get('code') != '200000':
+                    raise ValueError(f"code {sub_data.get('code')}: {sub_data.get('msg')}")
+                return name, parse_sub(sub_data.get('data') or {}), None
+            except Exception as e:
+                return name, None, e
+    
+    def add_sub(name, sub_bal):
+        for ccy, total in sub_bal.items():
+            result['total'][ccy] = result['total'].get(ccy, 0) + total
+        if sub_bal:
+            result['subaccounts'][name] = sub_bal
     
     # Master
     data = kucoin_req('/api/v1/accounts')
-    if data.get('code') == '200000':
-        balances = {}
-        for acc in data.get('data', []):
-            total = float(acc.get('balance', 0))
-            if total > 0:
-                ccy = acc['currency']
-                balances[ccy] = balances.get(ccy, 0) + total
-        result['master'] = balances
-        result['total'] = balances.copy()
+    if data.get('code') != '200000':
+        raise ValueError(f"code {data.get('code')}: {data.get('msg')}")
+    balances = {}
+    for acc in data.get('data', []):
+        total = float(acc.get('balance', 0))
+        if total > 0:
+            ccy = acc['currency']
+            balances[ccy] = balances.get(ccy, 0) + total
+    result['master'] = balances
+    result['total'] = balances.copy()
     
-    # Subaccounts
+    # Subaccounts - 전체 서브계정 잔고를 페이지 단위로 한 번에 (registry 목록도 같이 갱신)
+    reg = registry('kucoin')
     try:
-        subs = kucoin_req('/api/v2/sub/user')
-        if subs.get('code') == '200000':
-            for sub in subs.get('data', []):
-                uid = sub.get('userId')
-                name = sub.get('subName', uid)
-                try:
-                    sub_data = kucoin_req(f'/api/v1/sub-accounts/{uid}')
-                    if sub_data.get('code') == '200000':
-                        sub_bal = {}
-                        for acc_type in ['mainAccounts', 'tradeAccounts', 'marginAccounts']:
-                            for acc in sub_data.get('data', {}).get(acc_type, []):
-                                total = float(acc.get('balance', 0))
-                                if total > 0:
-                                    ccy = acc['currency']
-                                    sub_bal[ccy] = sub_bal.get(ccy, 0) + total
-                                    result['total'][ccy] = result['total'].get(ccy, 0) + total
-                        if sub_bal:
-                            result['subaccounts'][name] = sub_bal
-                except:
-                    pass
-    except:
-        pass
+        items = kucoin_pages('/api/v2/sub-accounts')
+        print(f"KuCoin subaccounts (bulk): {len(items)}")
+        reg.relist([(item.get('subName', item.get('subUserId')), item.get('subUserId')) for item in items])
+        for item in items:
+            name = item.get('subName', item.get('subUserId'))
+            sub_bal = parse_sub(item)
+            reg.record(name, sub_bal)
+            add_sub(name, sub_bal)
+        reg.save()
+        return result
+    except Exception as e:
+        print(f"KuCoin bulk subaccount error, falling back to per-account: {e}")
+    
+    # Fallback - 서브계정 목록 후 휴면이 아닌 계정만 병렬 조회
+    try:
+        members = dict(reg.discover(lambda: [
+            (sub.get('subName', sub.get('userId')), sub.get('userId')) for sub in kucoin_pages('/api/v2/sub/user')
+        ]))
+    except Exception as e:
+        print(f"KuCoin subaccount list error: {e}")
+        mark_failed(result, 'subaccounts')
+        return result
+    
+    due, dormant = reg.split(list(members))
+    mark_dormant(result, dormant)
+    if due:
+        with ThreadPoolExecutor(max_workers=min(KUCOIN_SUB_WORKERS, len(due))) as executor:
+            sub_results = list(executor.map(fetch_sub_tagged, due))
+        
+        for name, sub_bal, error in sub_results:
+            if error is not None:
+                print(f"KuCoin subaccount {name} error: {error}")
+                mark_failed(result, name)
+                continue
+            reg.record(name, sub_bal)
+            add_sub(name, sub_bal)
+    reg.save()
     
     return result
 
@@ -695,32 +2885,34 @@ def fetch_kraken():
     result = {'master': {}, 'subaccounts': {}, 'total': {}}
     
     path = '/0/private/Balance'
-    nonce = str(int(time.time() * 1000))
-    post_data = f'nonce={nonce}'
     
-    message = (nonce + post_data).encode()
-    sha256_hash = hashlib.sha256(message).digest()
-    hmac_data = path.encode() + sha256_hash
-    signature = base64.b64encode(hmac.new(base64.b64decode(api_secret), hmac_data, hashlib.sha512).digest()).decode()
-    
-    headers = {
-        'API-Key': api_key,
-        'API-Sign': signature,
-        'Content-Type': 'application/x-www-form-urlencoded'
-    }
+    def attempt():
+        # nonce는 매 시도마다 증가해야 함
+        nonce = str(int(time.time() * 1000))
+        post_data = f'nonce={nonce}'
+        
+        with phase('sign'):
+            message = (nonce + post_data).encode()
+            sha256_hash = hashlib.sha256(message).digest()
+            hmac_data = path.encode() + sha256_hash
+            signature = base64.b64encode(hmac.new(base64.b64decode(api_secret), hmac_data, hashlib.sha512).digest()).decode()
+        
+        headers = {
+            'API-Key': api_key,
+            'API-Sign': signature,
+            'Content-Type': 'application/x-www-form-urlencoded'
+        }
+        return http_request(f'https://api.kraken.com{path}', headers, method='POST', body=post_data)
     
-    req = urllib.request.Request(f'https://api.kraken.com{path}', headers=headers, method='POST')
-    req.data = post_data.encode()
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        data = json.loads(resp.read().decode())
+    data = resilient_call('kraken', attempt)
     
     if not data.get('error'):
         for ccy, bal in data.get('result', {}).items():
             total = float(bal)
             if total > 0:
-                clean_ccy = ccy[1:] if ccy.startswith(('X', 'Z')) and len(ccy) == 4 else ccy
-                result['master'][clean_ccy] = total
-                result['total'][clean_ccy] = total
+                clean_ccy = kraken_asset(ccy)
+                result['master'][clean_ccy] = result['master'].get(clean_ccy, 0) + total
+                result['total'][clean_ccy] = result['total'].get(clean_ccy, 0) + total
     
     return result
 
@@ -732,46 +2924,76 @@ def fetch_zoomex():
     
     result = {'master': {}, 'subaccounts': {}, 'total': {}}
     
-    timestamp = str(int(time.time() * 1000))
-    recv_window = '5000'
     query = 'accountType=UNIFIED'
-    sign_str = f"{timestamp}{api_key}{recv_window}{query}"
-    signature = hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).hexdigest()
     
-    headers = {
-        'X-BAPI-API-KEY': api_key,
-        'X-BAPI-TIMESTAMP': timestamp,
-        'X-BAPI-RECV-WINDOW': recv_window,
-        'X-BAPI-SIGN': signature
-    }
+    def attempt():
+        timestamp = str(int(time.time() * 1000))
+        recv_window = '5000'
+        with phase('sign'):
+            sign_str = f"{timestamp}{api_key}{recv_window}{query}"
+            signature = hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).hexdigest()
+        
+        headers = {
+            'X-BAPI-API-KEY': api_key,
+            'X-BAPI-TIMESTAMP': timestamp,
+            'X-BAPI-RECV-WINDOW': recv_window,
+            'X-BAPI-SIGN': signature
+        }
+        return http_request(f'https://openapi.zoomex.com/cloud/trade/v3/account/wallet-balance?{query}', headers)
     
-    data = http_request(f'https://openapi.zoomex.com/cloud/trade/v3/account/wallet-balance?{query}', headers)
-    
-    if data.get('retCode') == 0:
-        acc = data.get('result', {}).get('list', [{}])[0]
-        print(f"Zoomex totalEquity: {acc.get('totalEquity')}")
-        print(f"Zoomex totalWalletBalance: {acc.get('totalWalletBalance')}")
-        print(f"Zoomex totalPerpUPL: {acc.get('totalPerpUPL')}")
-        
-        result['upnl'] = {}
-        for coin in acc.get('coin', []):
-            # equity = walletBalance + unrealizedPnl
-            equity = float(coin.get('equity', 0))
-            wallet = float(coin.get('walletBalance', 0))
-            upl = float(coin.get('unrealisedPnl', 0))
-            if equity != 0 or wallet != 0:
-                print(f"  Zoomex {coin['coin']}: equity={equity}, wallet={wallet}, upl={upl}")
-                final_val = equity if equity != 0 else wallet
-                result['master'][coin['coin']] = final_val
-                result['total'][coin['coin']] = final_val
-                # uPnL 분리 저장
-                if upl != 0:
-                    result['upnl'][coin['coin']] = upl
+    data = resilient_call('zoomex', attempt)
+    
+    if data.get('retCode') != 0:
+        raise ValueError(f"retCode {data.get('retCode')}: {data.get('retMsg')}")
+    acc = data.get('result', {}).get('list', [{}])[0]
+    print(f"Zoomex totalEquity: {acc.get('totalEquity')}")
+    print(f"Zoomex totalWalletBalance: {acc.get('totalWalletBalance')}")
+    print(f"Zoomex totalPerpUPL: {acc.get('totalPerpUPL')}")
+    
+    result['upnl'] = {}
+    for coin in acc.get('coin', []):
+        # equity = walletBalance + unrealizedPnl
+        equity = float(coin.get('equity', 0))
+        wallet = float(coin.get('walletBalance', 0))
+        upl = float(coin.get('unrealisedPnl', 0))
+        if equity != 0 or wallet != 0:
+            print(f"  Zoomex {coin['coin']}: equity={equity}, wallet={wallet}, upl={upl}")
+            final_val = equity if equity != 0 else wallet
+            result['master'][coin['coin']] = final_val
+            result['total'][coin['coin']] = final_val
+            # uPnL 분리 저장
+            if upl != 0:
+                result['upnl'][coin['coin']] = upl
     
     return result
 
 
 # ============ HTX ============
+HTX_ACCOUNT_WORKERS = int(os.environ.get('HTX_ACCOUNT_WORKERS', '4'))
+HTX_ACCOUNTS_TTL = int(os.environ.get('HTX_ACCOUNTS_TTL', '3600'))  # 계정 목록은 거의 안 바뀜 - warm 컨테이너에서 재사용
+HTX_ACCOUNTS = {'key': None, 'accounts': None, 'fetched_at': 0}
+HTX_ACCOUNTS_LOCK = threading.Lock()
+# 0이 아닌 잔고 값 위치 - 행은 중괄호 없는 평평한 객체라 앞뒤 중괄호로 행 하나를 잘라냄
+HTX_NONZERO_RE = re.compile(rb'"balance"\s*:\s*"(?!-?0*\.?0*(?:[eE][-+]?\d+)?")')
+HTX_STATUS_RE = re.compile(rb'"status"\s*:\s*"([^"]*)"')
+
+
+def parse_htx_balance(raw):
+    """HTX 잔고 응답 파서 - 0 잔고 행(응답의 대부분)은 디코딩하지 않고 건너뜀
+
+    json.loads(raw)와 같은 모양에서 data.list만 0이 아닌 행으로 줄어든 dict 반환
+    """
+    status = HTX_STATUS_RE.search(raw)
+    if not status or status.group(1) != b'ok':
+        return json.loads(raw)  # 에러 응답은 작으므로 그대로
+    rows = []
+    for match in HTX_NONZERO_RE.finditer(raw):
+        start = raw.rfind(b'{', 0, match.start())
+        end = raw.find(b'}', match.end())
+        rows.append(json.loads(raw[start:end + 1]))
+    return {'status': 'ok', 'data': {'list': rows}}
+
+
 def fetch_htx():
     api_key = os.environ.get('HTX_API_KEY', '')
     api_secret = os.environ.get('HTX_API_SECRET', '')
@@ -781,66 +3003,103 @@ def fetch_htx():
     
     result = {'master': {}, 'subaccounts': {}, 'total': {}}
     
-    def htx_req(method, endpoint, params=None):
-        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
-        params = params or {}
-        params.update({
-            'AccessKeyId': api_key,
-            'SignatureMethod': 'HmacSHA256',
-            'SignatureVersion': '2',
-            'Timestamp': timestamp
-        })
-        
-        # Sort params and create query string
-        sorted_params = sorted(params.items())
-        query_string = urllib.parse.urlencode(sorted_params)
-        
-        # Create signature
-        sign_str = f"{method}\napi.huobi.pro\n{endpoint}\n{query_string}"
-        signature = base64.b64encode(
-            hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).digest()
-        ).decode()
-        
-        # URL encode signature
-        params['Signature'] = signature
-        url = f"https://api.huobi.pro{endpoint}?{urllib.parse.urlencode(params)}"
+    def htx_req(method, endpoint, params=None, parse=None):
+        def attempt():
+            timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+            signed = dict(params or {})
+            signed.update({
+                'AccessKeyId': api_key,
+                'SignatureMethod': 'HmacSHA256',
+                'SignatureVersion': '2',
+                'Timestamp': timestamp
+            })
+            
+            # Sort params and create query string
+            sorted_params = sorted(signed.items())
+            query_string = urllib.parse.urlencode(sorted_params)
+            
+            # Create signature
+            with phase('sign'):
+                sign_str = f"{method}\napi.huobi.pro\n{endpoint}\n{query_string}"
+                signature = base64.b64encode(
+                    hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).digest()
+                ).decode()
+            
+            # URL encode signature
+            signed['Signature'] = signature
+            url = f"https://api.huobi.pro{endpoint}?{urllib.parse.urlencode(signed)}"
+            
+            return http_request(url, parse=parse)
         
-        req = urllib.request.Request(url)
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            return json.loads(resp.read().decode())
+        return resilient_call('htx', attempt, hedge=True)
+    
+    def list_accounts():
+        """(id, type) 목록 - TTL 동안 캐시 (키가 바뀌면 다시 조회)"""
+        with HTX_ACCOUNTS_LOCK:
+            if (HTX_ACCOUNTS['key'] == api_key and HTX_ACCOUNTS['accounts'] is not None
+                    and time.time() - HTX_ACCOUNTS['fetched_at'] < HTX_ACCOUNTS_TTL):
+                return HTX_ACCOUNTS['accounts']
+        accounts_data = htx_req('GET', '/v1/account/accounts')
+        if accounts_data.get('status') != 'ok':
+            raise ValueError(f"status {accounts_data.get('status')}: {accounts_data.get('err-msg')}")
+        # spot, margin, otc, point, super-margin, etc
+        accounts = [(acc['id'], acc['type']) for acc in accounts_data.get('data', [])]
+        with HTX_ACCOUNTS_LOCK:
+            HTX_ACCOUNTS.update(key=api_key, accounts=accounts, fetched_at=time.time())
+        return accounts
+    
+    def fetch_account(account):
+        acc_id, _ = account
+        with metric_account(f'account:{acc_id}'):
+            try:
+                bal_data = htx_req('GET', f'/v1/account/accounts/{acc_id}/balance', parse=parse_htx_balance)
+                if bal_data.get('status') != 'ok':
+                    raise ValueError(f"status {bal_data.get('status')}: {bal_data.get('err-msg')}")
+                return bal_data.get('data', {}).get('list', []), None
+            except Exception as e:
+                return None, e
     
     # Step 1: Get all accounts
     try:
-        accounts_data = htx_req('GET', '/v1/account/accounts')
-        if accounts_data.get('status') == 'ok':
-            for acc in accounts_data.get('data', []):
-                acc_id = acc['id']
-                acc_type = acc['type']  # spot, margin, otc, point, super-margin, etc
-                
-                # Step 2: Get balance for each account
-                try:
-                    bal_data = htx_req('GET', f'/v1/account/accounts/{acc_id}/balance')
-                    if bal_data.get('status') == 'ok':
-                        for item in bal_data.get('data', {}).get('list', []):
-                            balance = float(item.get('balance', 0))
-                            if balance > 0:
-                                ccy = item['currency'].upper()
-                                bal_type = item['type']  # trade, frozen
-                                
-                                if acc_type == 'spot':
-                                    result['master'][ccy] = result['master'].get(ccy, 0) + balance
-                                    result['total'][ccy] = result['total'].get(ccy, 0) + balance
-                                    print(f"HTX spot {ccy}: {balance} ({bal_type})")
-                                else:
-                                    # margin, super-margin 등은 별도 키로
-                                    key = f"{ccy}_{acc_type.upper().replace('-', '_')}"
-                                    result['master'][key] = result['master'].get(key, 0) + balance
-                                    result['total'][key] = result['total'].get(key, 0) + balance
-                                    print(f"HTX {acc_type} {ccy}: {balance}")
-                except Exception as e:
-                    print(f"HTX account {acc_id} balance error: {e}")
+        accounts = list_accounts()
     except Exception as e:
         print(f"HTX accounts error: {e}")
+        raise  # 빈 잔고(0)로 보고하지 않고 실패로 - 스케줄러가 마지막 결과 사용
+    
+    # Step 2: 계정별 잔고 병렬 조회, 병합은 계정 순서대로
+    if accounts:
+        with ThreadPoolExecutor(max_workers=min(HTX_ACCOUNT_WORKERS, len(accounts))) as executor:
+            account_results = list(executor.map(fetch_account, accounts))
+    else:
+        account_results = []
+    
+    for (acc_id, acc_type), (rows, error) in zip(accounts, account_results):
+        if error is not None:
+            print(f"HTX account {acc_id} balance error: {error}")
+            mark_failed(result, f'account:{acc_id}')
+            # 계정이 없어졌을 수 있으므로 다음 조회에서 목록부터 다시
+            with HTX_ACCOUNTS_LOCK:
+                HTX_ACCOUNTS['accounts'] = None
+            continue
+        for item in rows:
+            balance = float(item.get('balance', 0))
+            if balance > 0:
+                ccy = item['currency'].upper()
+                bal_type = item['type']  # trade, frozen
+                
+                if acc_type == 'spot':
+                    result['master'][ccy] = result['master'].get(ccy, 0) + balance
+                    result['total'][ccy] = result['total'].get(ccy, 0) + balance
+                    print(f"HTX spot {ccy}: {balance} ({bal_type})")
+                else:
+                    # margin, super-margin 등은 별도 키로
+                    key = f"{ccy}_{acc_type.upper().replace('-', '_')}"
+                    result['master'][key] = result['master'].get(key, 0) + balance
+                    result['total'][key] = result['total'].get(key, 0) + balance
+                    print(f"HTX {acc_type} {ccy}: {balance}")
     
     return result
 
+
+# 모듈 로드 끝 - import 시점 초기화 시간 (lambda cold start의 init 구간)
+INIT_SECONDS = time.perf_counter() - INIT_STARTED
@@ -0,0 +1,95 @@
+"""collector WebSocket 프레임 파서 - socketpair로 서버 쪽 프레임을 나눠 보냄"""
+import os
+import socket
+import struct
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import collector  # noqa: E402
+
+
+def frame(payload, opcode=0x1, fin=True):
+    """서버 → 클라이언트 프레임 (마스킹 없음)"""
+    header = bytes([(0x80 if fin else 0) | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack('!H', length)
+    else:
+        header += bytes([127]) + struct.pack('!Q', length)
+    return header + payload
+
+
+def read_frame(sock):
+    """클라이언트 → 서버 프레임 (마스킹 해제) - (opcode, payload)"""
+    first, second = sock.recv(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', sock.recv(2))[0]
+    mask = sock.recv(4)
+    payload = b''
+    while len(payload) < length:
+        payload += sock.recv(length - len(payload))
+    return first & 0x0F, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+class WebSocketFrameTest(unittest.TestCase):
+    def setUp(self):
+        client, self.server = socket.socketpair()
+        client.settimeout(0.2)
+        self.addCleanup(client.close)
+        self.addCleanup(self.server.close)
+        # 핸드셰이크 없이 연결된 상태로
+        self.ws = collector.WebSocket.__new__(collector.WebSocket)
+        self.ws.sock = client
+        self.ws.lock = threading.Lock()
+        self.ws.buffer = b''
+        self.ws.fragments = b''
+
+    def test_lengths(self):
+        for size in (5, 125, 126, 300, 65535, 70000):
+            text = 'x' * size
+            threading.Thread(target=self.server.sendall, args=(frame(text.encode()),)).start()
+            self.assertEqual(self.ws.recv(), text)
+
+    def test_partial_frame_survives_timeout(self):
+        data = frame(b'{"e": "outboundAccountPosition"}') + frame(b'second')
+        self.server.sendall(data[:1])
+        with self.assertRaises(socket.timeout):
+            self.ws.recv()
+        self.server.sendall(data[1:20])
+        with self.assertRaises(socket.timeout):
+            self.ws.recv()
+        self.server.sendall(data[20:])
+        self.assertEqual(self.ws.recv(), '{"e": "outboundAccountPosition"}')
+        self.assertEqual(self.ws.recv(), 'second')
+
+    def test_extended_length_split_across_reads(self):
+        data = frame(b'y' * 1000)
+        self.server.sendall(data[:3])  # 16비트 길이 필드 중간에서 끊김
+        with self.assertRaises(socket.timeout):
+            self.ws.recv()
+        self.server.sendall(data[3:])
+        self.assertEqual(self.ws.recv(), 'y' * 1000)
+
+    def test_fragmented_message_with_ping_between(self):
+        self.server.sendall(frame(b'hel', fin=False) + frame(b'ping', opcode=0x9) + frame(b'lo', opcode=0x0))
+        self.assertEqual(self.ws.recv(), 'hello')
+        self.assertEqual(read_frame(self.server), (0xA, b'ping'))
+
+    def test_close_frame(self):
+        self.server.sendall(frame(b'', opcode=0x8))
+        with self.assertRaises(ConnectionError):
+            self.ws.recv()
+
+    def test_client_frames_are_masked(self):
+        self.ws.send('x' * 200)
+        self.assertEqual(read_frame(self.server), (0x1, b'x' * 200))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""응답 파서 - HTX 잔고 (0 잔고 행 건너뛰기)"""
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lambda_function as lf  # noqa: E402
+
+
+def htx_body(rows, status='ok'):
+    return json.dumps({'status': status, 'data': {'id': 1, 'type': 'spot', 'state': 'working', 'list': rows}})
+
+
+class HtxBalanceTest(unittest.TestCase):
+    def nonzero(self, rows):
+        return [row for row in rows if float(row['balance']) != 0]
+
+    def test_matches_json_for_nonzero_rows(self):
+        rows = [
+            {'currency': 'btc', 'type': 'trade', 'balance': '0.5', 'seq-num': '1'},
+            {'currency': 'btc', 'type': 'frozen', 'balance': '0', 'seq-num': '2'},
+            {'currency': 'eth', 'type': 'trade', 'balance': '0.000000000000000000', 'seq-num': '3'},
+            {'currency': 'usdt', 'type': 'trade', 'balance': '0.00000001', 'seq-num': '4'},
+            {'currency': 'usdt', 'type': 'frozen', 'balance': '-0', 'seq-num': '5'},
+            {'currency': 'sol', 'type': 'trade', 'balance': '1e-8', 'seq-num': '6'},
+            {'currency': 'doge', 'type': 'trade', 'balance': '0e0', 'seq-num': '7'},
+            {'currency': 'xrp', 'type': 'trade', 'balance': '120', 'seq-num': '8'},
+            {'currency': 'ada', 'type': 'trade', 'balance': '.0', 'seq-num': '9'},
+            {'currency': 'ltc', 'type': 'trade', 'balance': '10.0', 'seq-num': '10'},
+        ]
+        parsed = lf.parse_htx_balance(htx_body(rows).encode())
+        self.assertEqual(parsed['status'], 'ok')
+        self.assertEqual(parsed['data']['list'], self.nonzero(rows))
+
+    def test_spacing_and_key_order(self):
+        raw = (b'{"status" : "ok", "data": {"list": [\n'
+               b'  {"balance" : "2.5", "currency": "btc", "type": "trade"},\n'
+               b'  {"currency": "eth", "balance": "0.0", "type": "trade"}\n'
+               b']}}')
+        parsed = lf.parse_htx_balance(raw)
+        self.assertEqual(parsed['data']['list'], [{'balance': '2.5', 'currency': 'btc', 'type': 'trade'}])
+
+    def test_error_response_is_returned_as_is(self):
+        raw = json.dumps({'status': 'error', 'err-code': 'api-signature-not-valid', 'err-msg': 'bad'}).encode()
+        self.assertEqual(lf.parse_htx_balance(raw), json.loads(raw))
+
+    def test_empty_list(self):
+        self.assertEqual(lf.parse_htx_balance(htx_body([]).encode()), {'status': 'ok', 'data': {'list': []}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""스냅샷 delta/keyframe 저장과 복원 - 메모리 테이블로 pk/sk 테이블 동작을 흉내냄
+
+    python -m pytest lambda/tests
+"""
+import importlib.util
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lambda_function as lf  # noqa: E402
+
+HAS_BOTO3 = importlib.util.find_spec('boto3') is not None
+
+
+def matches(item, condition):
+    """boto3 KeyConditionExpression 평가 (eq, lt, lte, gt, gte, between, begins_with, AND)"""
+    expr = condition.get_expression()
+    operator, values = expr['operator'], expr['values']
+    if operator == 'AND':
+        return all(matches(item, value) for value in values)
+    value = item.get(values[0].name)
+    if value is None:
+        return False
+    if operator == 'BETWEEN':
+        return values[1] <= value <= values[2]
+    if operator == 'begins_with':
+        return value.startswith(values[1])
+    return {
+        '=': value == values[1],
+        '<': value < values[1],
+        '<=': value <= values[1],
+        '>': value > values[1],
+        '>=': value >= values[1],
+    }[operator]
+
+
+class FakeTable:
+    """pk/sk 테이블 - 한 번의 query에 전부 반환 (페이지 없음)"""
+
+    def __init__(self):
+        self.items = {}
+        self.fail_writes = False
+        self.name = 'fake'
+
+    def put_item(self, Item, **kwargs):
+        if self.fail_writes:
+            raise RuntimeError('write failed')
+        self.items[(Item['pk'], Item['sk'])] = dict(Item)
+
+    def get_item(self, Key):
+        item = self.items.get((Key['pk'], Key['sk']))
+        return {'Item': dict(item)} if item else {}
+
+    def query(self, KeyConditionExpression, ScanIndexForward=True, Limit=None, **kwargs):
+        items = sorted(
+            (dict(item) for item in self.items.values() if matches(item, KeyConditionExpression)),
+            key=lambda item: item['sk'], reverse=not ScanIndexForward,
+        )
+        return {'Items': items[:Limit] if Limit else items}
+
+    def batch_writer(self):
+        return FakeBatch(self)
+
+
+class FakeBatch:
+    """batch_writer - with 블록이 끝날 때 한꺼번에 기록"""
+
+    def __init__(self, table):
+        self.table = table
+        self.pending = []
+
+    def put_item(self, Item):
+        self.pending.append(Item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            for item in self.pending:
+                self.table.put_item(Item=item)
+        return False
+
+
+def snapshot(n, balances):
+    return {
+        'timestamp': f'2026-01-01T00:{n:02d}:00+00:00',
+        'grand_total_usd': sum(d.get('exchange_total_usd', 0) for d in balances.values()),
+        'balances': balances,
+    }
+
+
+def binance(btc, subs=None):
+    return {
+        'master': {'BTC': btc},
+        'subaccounts': subs or {},
+        'total': {'BTC': btc},
+        'exchange_total_usd': btc * 100000,
+    }
+
+
+@unittest.skipUnless(HAS_BOTO3, 'boto3 not installed')
+class SnapshotChainTest(unittest.TestCase):
+    def setUp(self):
+        self.table = FakeTable()
+        patches = [
+            mock.patch.object(lf, 'snapshot_items_table', lambda: self.table),
+            mock.patch.object(lf, 'SNAPSHOT_KEYFRAME_EVERY', 3),
+            mock.patch.dict(lf.SNAPSHOT_STATE, clear=True),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def kinds(self, exchange='binance'):
+        return [item['kind'] for key, item in sorted(self.table.items.items()) if key[0] == f'EXCHANGE#{exchange}']
+
+    def saved_states(self):
+        sks = sorted(sk for pk, sk in self.table.items if pk == 'SNAPSHOT')
+        states = lf.replay_exchange('binance', sks)
+        return [lf.unflatten_tree(states[sk][0]) for sk in sks]
+
+    def test_delta_chain_with_keyframes(self):
+        versions = [binance(1.0), binance(1.0), binance(1.5), binance(2.0, {'a': {'ETH': 3.0}}),
+                    binance(2.0, {'a': {'ETH': 4.0}}), binance(2.5), binance(3.0)]
+        for n, version in enumerate(versions):
+            lf.save_snapshot(snapshot(n, {'binance': version}))
+        # 변경 없는 스냅샷은 아이템 없음, delta가 SNAPSHOT_KEYFRAME_EVERY만큼 쌓이면 전체 저장
+        self.assertEqual(self.kinds(), ['full', 'delta', 'delta', 'delta', 'full', 'delta'])
+        self.assertEqual(self.saved_states(), versions)
+
+    def test_reload_when_another_container_saved(self):
+        lf.save_snapshot(snapshot(0, {'binance': binance(1.0)}))
+        lf.save_snapshot(snapshot(1, {'binance': binance(2.0)}))
+        # 다른 컨테이너가 저장해서 메모리의 기준이 최신 아이템이 아님
+        lf.SNAPSHOT_STATE['binance'] = {'flat': lf.flatten_tree(binance(1.0)), 'sk': 'stale', 'chain': 0}
+        lf.save_snapshot(snapshot(2, {'binance': binance(2.0)}))
+        self.assertEqual(self.kinds(), ['full', 'delta'])
+        lf.save_snapshot(snapshot(3, {'binance': binance(3.0)}))
+        self.assertEqual(self.saved_states(), [binance(1.0), binance(2.0), binance(2.0), binance(3.0)])
+
+    def test_failed_save_keeps_previous_base(self):
+        lf.save_snapshot(snapshot(0, {'binance': binance(1.0)}))
+        self.table.fail_writes = True
+        with mock.patch.object(lf, 'update_rollups') as rollups:
+            lf.save_snapshot(snapshot(1, {'binance': binance(2.0)}))
+        rollups.assert_not_called()
+        self.assertEqual(lf.SNAPSHOT_STATE, {})
+        self.table.fail_writes = False
+        lf.save_snapshot(snapshot(2, {'binance': binance(3.0)}))
+        self.assertEqual(self.kinds(), ['full', 'delta'])
+        self.assertEqual(self.saved_states(), [binance(1.0), binance(3.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()